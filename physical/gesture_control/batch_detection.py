@@ -0,0 +1,185 @@
+"""
+Vectorized gesture classification
+Classifies whole blocks of tracking data with NumPy instead of one SDK hand
+object at a time. Data is laid out as a struct of arrays, one row per frame
+and one column per hand slot:
+
+    extended       (N, H, 5) bool    finger extended flags, thumb first
+    velocity       (N, H, 3) float   palm velocity in mm/s, NaN when unknown
+    grab_strength  (N, H)    float   0 = open hand, 1 = fist
+    valid          (N, H)    bool    False where the slot holds no hand
+
+BatchDetector carries the configured swipe threshold and palm filter.
+GestureToPLC.detect_gesture fills a 1 x 1 block through it, and
+BatchDetector.build_block fills whole blocks from recorded frames the same
+way, so live tracking and re-processing recorded data share the same rules.
+"""
+
+import numpy as np
+from motion_filter import PalmMotionFilter
+
+GESTURE_LABELS = np.array(['none', 'swipe_left', 'swipe_right', 'swipe_up', 'swipe_down',
+                           'circle', 'pointing', 'peace', 'open_palm'])
+(NONE, SWIPE_LEFT, SWIPE_RIGHT, SWIPE_UP, SWIPE_DOWN,
+ CIRCLE, POINTING, PEACE, OPEN_PALM) = range(len(GESTURE_LABELS))
+
+
+class HandBlock:
+    def __init__(self, frames, hands=2):
+        """
+        Allocate an empty block (every slot invalid)
+
+        Args:
+            frames: Number of frames (N)
+            hands: Hand slots per frame (H)
+        """
+        self.extended = np.zeros((frames, hands, 5), dtype=bool)
+        self.velocity = np.full((frames, hands, 3), np.nan)
+        self.grab_strength = np.zeros((frames, hands))
+        self.valid = np.zeros((frames, hands), dtype=bool)
+
+    @classmethod
+    def from_hands(cls, frames, hands=2):
+        """
+        Build a block from SDK hand objects, e.g. recorded tracking events
+
+        Args:
+            frames: Sequence of per-frame hand lists (such as event.hands)
+            hands: Hand slots per frame; extra hands in a frame are ignored
+        """
+        frames = list(frames)
+        block = cls(len(frames), hands)
+        for f, frame_hands in enumerate(frames):
+            for slot, hand in enumerate(frame_hands[:hands]):
+                block.set_hand(f, slot, hand)
+        return block
+
+    def set_hand(self, frame, slot, hand, velocity=None):
+        """
+        Copy one SDK hand into the block
+
+        Args:
+            frame: Frame row
+            slot: Hand column
+            hand: SDK hand object
+            velocity: (x, y, z) to use instead of hand.palm.velocity (e.g. filtered)
+        """
+        digits = getattr(hand, 'digits', None) or getattr(hand, 'fingers', None) or []
+        if len(digits) < 5:
+            self.valid[frame, slot] = False
+            return
+
+        self.extended[frame, slot] = [d.is_extended for d in digits[:5]]
+        if velocity is None:
+            palm_velocity = getattr(hand.palm, 'velocity', None)
+            if palm_velocity is not None:
+                velocity = (palm_velocity.x, palm_velocity.y, palm_velocity.z)
+        self.velocity[frame, slot] = velocity if velocity is not None else np.nan
+        self.grab_strength[frame, slot] = hand.grab_strength
+        self.valid[frame, slot] = True
+
+
+def detect_batch(block, swipe_speed=800, poses=True):
+    """
+    Classify every hand slot in a block
+
+    Rules match the per-frame detector: a fast palm is a swipe along its
+    dominant axis; otherwise (with poses) index only is circle when the hand
+    is open and pointing when not, index + middle is peace, all five is
+    open palm. Velocities are used as given, so apply any smoothing first.
+
+    Args:
+        block: HandBlock to classify
+        swipe_speed: Palm speed (mm/s) above which movement is a swipe
+        poses: Also classify static hand poses, not just swipes
+
+    Returns:
+        (N, H) int8 array of label codes; GESTURE_LABELS[codes] gives names
+    """
+    velocity = block.velocity
+    vx = velocity[..., 0]
+    vy = velocity[..., 1]
+    speed = np.sqrt((velocity * velocity).sum(axis=-1))
+
+    # Rules are applied lowest priority first so later ones overwrite
+    labels = np.zeros(block.valid.shape, dtype=np.int8)
+    if poses:
+        extended = block.extended
+        count = extended.sum(axis=-1)
+        index = extended[..., 1]
+        labels[count == 5] = OPEN_PALM
+        labels[(count == 2) & index & extended[..., 2]] = PEACE
+        only_index = (count == 1) & index
+        labels[only_index] = np.where(block.grab_strength[only_index] < 0.3, CIRCLE, POINTING)
+
+    # NaN speed (no velocity) compares False, so those hands never swipe
+    fast = speed > swipe_speed
+    horizontal = np.where(vx > 0, SWIPE_RIGHT, SWIPE_LEFT)
+    vertical = np.where(vy > 0, SWIPE_UP, SWIPE_DOWN)
+    labels[fast] = np.where(np.abs(vx) > np.abs(vy), horizontal, vertical)[fast]
+
+    labels[~block.valid] = NONE
+    return labels
+
+
+class BatchDetector:
+    def __init__(self, swipe_speed=800, poses=True, motion_filter=None):
+        """
+        Detection settings shared by live tracking and block processing
+
+        Args:
+            swipe_speed: Palm speed (mm/s) above which movement is a swipe
+            poses: Also classify static hand poses, not just swipes
+            motion_filter: PalmMotionFilter applied to palm velocity, or None for raw velocity
+        """
+        self.swipe_speed = swipe_speed
+        self.poses = poses
+        self.motion_filter = motion_filter
+
+    @classmethod
+    def from_config(cls, config, poses=True):
+        """Build a detector from the 'detection' and 'motion_filter' config sections"""
+        return cls(config.get('detection', {}).get('swipe_speed', 800), poses,
+                   PalmMotionFilter.from_config(config))
+
+    def palm_velocity(self, hand, timestamp):
+        """
+        Palm velocity to classify a hand with
+
+        Args:
+            hand: SDK hand object
+            timestamp: Frame time in seconds (drives the motion filter)
+
+        Returns:
+            (x, y, z) filtered when a motion filter is set, or None if the hand has no velocity
+        """
+        velocity = getattr(hand.palm, 'velocity', None)
+        if not velocity:
+            return None
+        velocity = (velocity.x, velocity.y, velocity.z)
+        if self.motion_filter is None:
+            return velocity
+        position = hand.palm.position
+        _, velocity = self.motion_filter.update(
+            hand.id, timestamp, (position.x, position.y, position.z), velocity)
+        return velocity
+
+    def build_block(self, frames, timestamps, hands=2):
+        """
+        Build a block from recorded SDK hands, filtering palm velocity frame by frame
+
+        Args:
+            frames: Sequence of per-frame hand lists (such as event.hands)
+            timestamps: Frame times in seconds, one per frame, in recording order
+            hands: Hand slots per frame; extra hands in a frame are ignored
+        """
+        frames = list(frames)
+        block = HandBlock(len(frames), hands)
+        for f, (frame_hands, timestamp) in enumerate(zip(frames, timestamps)):
+            for slot, hand in enumerate(frame_hands[:hands]):
+                block.set_hand(f, slot, hand, self.palm_velocity(hand, timestamp))
+        return block
+
+    def detect(self, block):
+        """Classify a block with this detector's threshold; see detect_batch"""
+        return detect_batch(block, self.swipe_speed, self.poses)
@@ -0,0 +1,169 @@
+"""
+PLC connection supervisor
+Watches I/O results from the write scheduler. After repeated failures it
+marks the link down, reconnects in the background with jittered
+exponential backoff (trying any secondary endpoints in turn), and keeps
+a small, age-limited buffer of gestures issued during the outage to
+replay once the link is back.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from metrics import REGISTRY
+
+LINK_UP = REGISTRY.gauge('plc_link_up', 'Supervisor view of the PLC link (1 up, 0 down)')
+OUTAGES = REGISTRY.counter('plc_outages_total', 'Times the PLC link was declared down')
+RECOVERY_TIME = REGISTRY.summary('plc_recovery_seconds', 'Time from link down to reconnected')
+FAILOVERS = REGISTRY.counter('plc_failovers_total', 'Reconnects that landed on a secondary endpoint')
+REPLAYED = REGISTRY.counter('gestures_replayed_total', 'Gestures buffered during an outage and replayed')
+DROPPED = REGISTRY.counter('gestures_outage_dropped_total', 'Gestures lost to an outage', ('reason',))
+
+
+def _parse_endpoint(endpoint):
+    """'host' or 'host:port' -> (host, port or None)"""
+    host, _, port = str(endpoint).partition(':')
+    return host, int(port) if port else None
+
+
+class ConnectionSupervisor:
+    def __init__(self, plc, endpoints=None, failure_threshold=2, base_delay=0.2,
+                 max_delay=5.0, jitter=0.5, replay_size=8, replay_max_age=1.0):
+        """
+        Initialize the supervisor for one communicator
+
+        Args:
+            plc: Communicator with connect() / disconnect() / get_connection_state()
+            endpoints: Secondary endpoints ('host' or 'host:port') tried after the primary
+            failure_threshold: Consecutive I/O failures that mark the link down
+            base_delay: First backoff delay in seconds
+            max_delay: Backoff ceiling in seconds
+            jitter: Fraction of each delay randomised (+/-) to avoid reconnect storms
+            replay_size: Gestures kept for replay; older ones are dropped first
+            replay_max_age: Seconds after detection a buffered gesture may still be replayed
+        """
+        self.plc = plc
+        primary = (plc.ip, getattr(plc, 'port', None))
+        self.endpoints = [primary] + [_parse_endpoint(e) for e in (endpoints or [])]
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.replay_max_age = replay_max_age
+
+        self.buffer = deque(maxlen=replay_size)
+        self.on_recover = None    # Called with the replayable gestures after reconnecting
+        self.failures = 0
+        self.up = True
+        self.down_since = None
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = None
+        LINK_UP.set(1)
+
+    @classmethod
+    def from_config(cls, plc, config):
+        """Build a supervisor from the 'supervisor' config section"""
+        section = config.get('supervisor', {})
+        return cls(plc,
+                   endpoints=section.get('endpoints'),
+                   failure_threshold=section.get('failure_threshold', 2),
+                   base_delay=section.get('base_delay', 0.2),
+                   max_delay=section.get('max_delay', 5.0),
+                   jitter=section.get('jitter', 0.5),
+                   replay_size=section.get('replay_size', 8),
+                   replay_max_age=section.get('replay_max_age', 1.0))
+
+    def is_up(self):
+        return self.up
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        """Count a failed operation; declare the link down past the threshold"""
+        self.failures += 1
+        if self.plc.get_connection_state() != "CONNECTED" or self.failures >= self.failure_threshold:
+            self._link_down()
+
+    def hold(self, gesture, detected_at):
+        """Keep a gesture that could not be sent for replay after recovery"""
+        with self.lock:
+            # Held while the link still looked up, then never replayed: now stale
+            stale = 0
+            while self.buffer and time.monotonic() - self.buffer[0][1] > self.replay_max_age:
+                self.buffer.popleft()
+                stale += 1
+            if stale:
+                DROPPED.labels('stale').inc(stale)
+            if len(self.buffer) == self.buffer.maxlen:
+                DROPPED.labels('overflow').inc()
+            self.buffer.append((gesture, detected_at))
+
+    def drop(self, reason):
+        """Count a gesture lost to the outage that never reached the buffer"""
+        DROPPED.labels(reason).inc()
+
+    def _link_down(self):
+        with self.lock:
+            if not self.up:
+                return
+            self.up = False
+            self.down_since = time.monotonic()
+        LINK_UP.set(0)
+        OUTAGES.inc()
+        print("[SUPERVISOR] PLC link down, reconnecting in background")
+        self.thread = threading.Thread(target=self._reconnect_loop, name='plc-reconnect', daemon=True)
+        self.thread.start()
+
+    def _backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def _try_endpoint(self, host, port):
+        self.plc.disconnect()
+        self.plc.ip = host
+        if port is not None:
+            self.plc.port = port
+        return self.plc.connect()
+
+    def _reconnect_loop(self):
+        attempt = 0
+        while self.running:
+            # Fast failover: each round tries every endpoint back-to-back
+            for index, (host, port) in enumerate(self.endpoints):
+                if self._try_endpoint(host, port):
+                    self._link_up(host, port, secondary=index > 0)
+                    return
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _link_up(self, host, port, secondary):
+        elapsed = time.monotonic() - self.down_since
+        RECOVERY_TIME.observe(elapsed)
+        if secondary:
+            FAILOVERS.inc()
+        endpoint = f"{host}:{port}" if port is not None else host
+        print(f"[SUPERVISOR] Reconnected to {endpoint} after {elapsed:.2f}s")
+
+        now = time.monotonic()
+        with self.lock:
+            held = list(self.buffer)
+            self.buffer.clear()
+            self.failures = 0
+            self.up = True
+        LINK_UP.set(1)
+
+        fresh = [(g, t) for g, t in held if now - t <= self.replay_max_age]
+        if len(fresh) < len(held):
+            DROPPED.labels('stale').inc(len(held) - len(fresh))
+        if fresh:
+            REPLAYED.inc(len(fresh))
+        if self.on_recover:
+            self.on_recover(fresh)
@@ -0,0 +1,239 @@
+"""
+Multi-device gesture aggregation
+Attaches to every Leap controller on the connection. Each device gets its
+own worker thread and its own GestureToPLC (cooldowns, palm filter), so a
+busy or stalled device never delays another. Gestures from all devices are
+merged into one stream ordered by detection time, and the same gesture seen
+by several controllers at once is forwarded to the PLC only once.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import leap
+from metrics import REGISTRY
+
+DEVICE_FRAMES = REGISTRY.counter('leap_device_frames_total', 'Tracking frames received per device', ('device',))
+DEVICE_SHED = REGISTRY.counter('leap_device_frames_shed_total', 'Frames dropped because a device worker fell behind', ('device',))
+DEVICE_LAG = REGISTRY.summary('leap_device_queue_seconds', 'Time frames wait for their device worker', ('device',))
+MERGED = REGISTRY.counter('gestures_merged_total', 'Gestures forwarded from the merged stream', ('device',))
+DEDUPED = REGISTRY.counter('gestures_deduplicated_total', 'Gestures dropped as duplicates seen by another device', ('gesture',))
+
+
+def _vector(v):
+    return SimpleNamespace(x=v.x, y=v.y, z=v.z)
+
+
+def _snapshot_hand(device_id, hand):
+    """Copy the fields detection uses out of SDK memory that is only valid during the callback"""
+    digits = getattr(hand, 'digits', None) or getattr(hand, 'fingers', [])
+    palm = hand.palm
+    velocity = getattr(palm, 'velocity', None)
+    return SimpleNamespace(
+        id=(device_id, hand.id),
+        digits=[SimpleNamespace(is_extended=d.is_extended) for d in digits],
+        palm=SimpleNamespace(direction=_vector(palm.direction),
+                             position=_vector(palm.position),
+                             velocity=_vector(velocity) if velocity is not None else None),
+        grab_strength=hand.grab_strength)
+
+
+def _snapshot_event(device_id, event):
+    return SimpleNamespace(
+        device_id=device_id,
+        tracking_frame_id=getattr(event, 'tracking_frame_id', None),
+        timestamp=getattr(event, 'timestamp', None),
+        hands=[_snapshot_hand(device_id, hand) for hand in event.hands])
+
+
+class GestureMerger:
+    def __init__(self, scheduler, dedup_window=0.15, reorder_window=0.02):
+        """
+        Initialize the merged gesture stream
+
+        Args:
+            scheduler: WriteScheduler that receives the merged gestures
+            dedup_window: Seconds within which the same gesture from any device is one gesture
+            reorder_window: Seconds a gesture is held so slightly later devices can sort ahead of it
+        """
+        self.scheduler = scheduler
+        self.dedup_window = dedup_window
+        self.reorder_window = reorder_window
+
+        self.heap = []            # (detected_at, seq, device_id, gesture, on_done)
+        self.seq = itertools.count()
+        self.last_sent = {}       # gesture -> detected_at of the last forwarded copy
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='gesture-merge', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+    def push(self, device_id, gesture, detected_at, on_done=None):
+        with self.cond:
+            heapq.heappush(self.heap, (detected_at, next(self.seq), device_id, gesture, on_done))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    if self.heap:
+                        wait = self.heap[0][0] + self.reorder_window - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self.cond.wait(wait)
+                    else:
+                        self.cond.wait()
+                if not self.running:
+                    return
+                detected_at, _, device_id, gesture, on_done = heapq.heappop(self.heap)
+
+            last = self.last_sent.get(gesture)
+            if last is not None and detected_at - last < self.dedup_window:
+                DEDUPED.labels(gesture).inc()
+                if on_done:
+                    on_done(False)
+                continue
+            self.last_sent[gesture] = detected_at
+            MERGED.labels(device_id).inc()
+            self.scheduler.submit(gesture, detected_at, on_done)
+
+
+class _DeviceSink:
+    """Stands in for the scheduler of one device's GestureToPLC and feeds the merger"""
+
+    def __init__(self, merger, device_id):
+        self.merger = merger
+        self.device_id = device_id
+
+    def submit(self, gesture, detected_at=None, on_done=None):
+        self.merger.push(self.device_id, gesture,
+                         detected_at if detected_at is not None else time.monotonic(), on_done)
+
+
+class DeviceWorker:
+    def __init__(self, device_id, detector, queue_size=4):
+        """
+        Run detection for one device on its own thread
+
+        Args:
+            device_id: LeapC device id the frames come from
+            detector: GestureToPLC instance owned by this device
+            queue_size: Frames buffered before the oldest is dropped
+        """
+        self.device_id = device_id
+        self.detector = detector
+        self.frames = deque(maxlen=queue_size)
+        self.cond = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f'leap-device-{device_id}', daemon=True)
+        self.thread.start()
+
+    def put(self, frame):
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                # Stale frames are worth less than fresh ones: drop the oldest
+                DEVICE_SHED.labels(self.device_id).inc()
+            self.frames.append((time.monotonic(), frame))
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join(timeout=2.0)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.frames:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                queued_at, frame = self.frames.popleft()
+            DEVICE_LAG.labels(self.device_id).observe(time.monotonic() - queued_at)
+            self.detector.on_tracking_event(frame)
+
+
+class MultiDeviceListener(leap.Listener):
+    def __init__(self, connection, detector_factory, merger, queue_size=4):
+        """
+        Initialize the multi-device listener
+
+        Args:
+            connection: leap.Connection opened with multi_device_aware=True
+            detector_factory: Callable taking a scheduler-like sink and a device id, returning a GestureToPLC
+            merger: GestureMerger shared by all devices
+            queue_size: Frames buffered per device
+        """
+        super().__init__()
+        self.connection = connection
+        self.detector_factory = detector_factory
+        self.merger = merger
+        self.queue_size = queue_size
+        self.workers = {}         # device id -> DeviceWorker
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, connection, detector_factory, scheduler, config):
+        """Build the listener and its merger from the 'multi_device' config section"""
+        section = config.get('multi_device', {})
+        merger = GestureMerger(scheduler,
+                               dedup_window=section.get('dedup_window', 0.15),
+                               reorder_window=section.get('reorder_window', 0.02))
+        merger.start()
+        return cls(connection, detector_factory, merger, section.get('queue_size', 4))
+
+    def stop(self):
+        for worker in list(self.workers.values()):
+            worker.stop()
+        self.merger.stop()
+
+    def on_connection_event(self, event):
+        print("[LEAP] Connected to Leap Motion service (multi-device)")
+
+    def on_device_event(self, event):
+        try:
+            with event.device.open():
+                info = event.device.get_info()
+        except leap.LeapCannotOpenDeviceError:
+            info = event.device.get_info()
+        # Multi-device connections only deliver tracking for subscribed devices
+        self.connection.subscribe_events(event.device)
+        print(f"[LEAP] Device found: {info.serial}")
+
+    def on_tracking_event(self, event):
+        # Runs on the SDK's polling thread: snapshot and hand off, nothing else
+        metadata = getattr(event, 'metadata', None)
+        device_id = getattr(metadata, 'device_id', 0)
+        DEVICE_FRAMES.labels(device_id).inc()
+
+        worker = self.workers.get(device_id)
+        if worker is None:
+            worker = self._add_worker(device_id)
+        worker.put(_snapshot_event(device_id, event))
+
+    def _add_worker(self, device_id):
+        with self.lock:
+            worker = self.workers.get(device_id)
+            if worker is None:
+                detector = self.detector_factory(_DeviceSink(self.merger, device_id), device_id)
+                worker = DeviceWorker(device_id, detector, self.queue_size)
+                self.workers[device_id] = worker
+                print(f"[LEAP] Detection worker started for device {device_id}")
+            return worker
@@ -1,11 +1,30 @@
 import snap7
 from snap7.util import *
-from snap7.types import Areas
+from snap7.types import Areas, Parameter
+import math
 import time
 import json
 import os
+from metrics import REGISTRY
+
+PLC_CONNECTED = REGISTRY.gauge('plc_connected', 'PLC connection up (1) or down (0)')
+PLC_CONNECTS = REGISTRY.counter('plc_connect_attempts_total', 'PLC connection attempts by result', ('result',))
+PLC_RECONNECTS = REGISTRY.counter('plc_reconnects_total', 'Successful connections after the first one')
+PLC_WRITES = REGISTRY.counter('plc_writes_total', 'PLC gesture writes by result', ('result',))
+PLC_READS = REGISTRY.counter('plc_reads_total', 'PLC gesture reads by result', ('result',))
+PLC_WRITE_LATENCY = REGISTRY.summary('plc_write_latency_seconds', 'Round-trip time of successful PLC writes')
+PLC_EXPIRED = REGISTRY.counter('plc_operations_expired_total', 'PLC operations abandoned at their deadline', ('op',))
+
+# Seconds; overridden by the "timeouts" section of the config
+DEFAULT_TIMEOUTS = {'connect': 2.0, 'send': 0.5, 'receive': 0.5, 'operation': 0.25}
+
+
+class DeadlineExpired(TimeoutError):
+    """Raised when an operation's deadline passes before it is done"""
 
 class PLCCommunicator:
+    counter_bytes = 2  # write_counter() fills a whole %MW word
+
     def __init__(self, ip='192.168.2.23', rack=0, slot=1, config_file='gesture_config.json'):
         """
         Initialize physical PLC communicator using snap7
@@ -20,6 +39,7 @@ class PLCCommunicator:
         self.rack = rack
         self.slot = slot
         self.client = None
+        self.connected_once = False
         
         # Load configuration
         self.load_config(config_file)
@@ -31,6 +51,8 @@ class PLCCommunicator:
         
         with open(config_file, 'r') as f:
             config = json.load(f)
+        self.config = config
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **config.get('timeouts', {}))
         
         # Get active gesture set
         active_set = config.get('active_set', 'primary')
@@ -52,16 +74,27 @@ class PLCCommunicator:
         try:
             print(f"[CONNECT] Connecting to PLC at {self.ip}...")
             self.client = snap7.client.Client()
+            # snap7 uses the ping timeout for the TCP connect itself
+            self.client.set_param(Parameter.PingTimeout, int(self.timeouts['connect'] * 1000))
+            self.client.set_param(Parameter.SendTimeout, int(self.timeouts['send'] * 1000))
+            self.client.set_param(Parameter.RecvTimeout, int(self.timeouts['receive'] * 1000))
             self.client.connect(self.ip, self.rack, self.slot)
             
             if self.client.get_connected():
                 print(f"[SUCCESS] Connected to PLC at {self.ip}")
+                PLC_CONNECTS.labels('ok').inc()
+                PLC_CONNECTED.set(1)
+                if self.connected_once:
+                    PLC_RECONNECTS.inc()
+                self.connected_once = True
                 return True
             else:
                 print(f"[ERROR] Connection failed (not connected)")
+                PLC_CONNECTS.labels('error').inc()
                 return False
         except Exception as e:
             print(f"[ERROR] Connection failed: {e}")
+            PLC_CONNECTS.labels('error').inc()
             return False
     
     def disconnect(self):
@@ -70,50 +103,166 @@ class PLCCommunicator:
             if self.client and self.client.get_connected():
                 self.client.disconnect()
                 print("[DISCONNECT] Disconnected from PLC")
+            PLC_CONNECTED.set(0)
         except Exception as e:
             print(f"[ERROR] Disconnect error: {e}")
     
-    def write_gesture(self, gesture_name, value):
+    def write_gesture(self, gesture_name, value, deadline=None):
         """
         Write a gesture state to PLC memory
         
         Args:
             gesture_name: Name of gesture (e.g., 'swipe_left')
             value: Boolean value (True/False)
+            deadline: time.monotonic() value after which the write is
+                abandoned (default: now + the 'operation' timeout)
         """
         if gesture_name not in self.gesture_addresses:
             print(f"[ERROR] Unknown gesture: {gesture_name}")
             return False
         
         area, byte_offset, bit_offset = self.gesture_addresses[gesture_name]
+        mask = 1 << bit_offset
+        
+        try:
+            if value:
+                result = self.update_byte(byte_offset, set_mask=mask, deadline=deadline)
+            else:
+                result = self.update_byte(byte_offset, clear_mask=mask, deadline=deadline)
+        except (DeadlineExpired, PermissionError):
+            # Expired, or (through the multiplexer) another client owns the bit
+            return False
+        return result is not None
+    
+    def _bound_io(self, deadline, op):
+        """
+        Cap snap7's send/receive timeouts at what is left of the deadline
+        
+        Args:
+            deadline: time.monotonic() value the next call must finish by
+            op: 'read' or 'write', for the expiry metric
+            
+        Returns:
+            True if the deadline, not the configured timeouts, is the limit
+            
+        Raises:
+            DeadlineExpired: Nothing is left of the deadline
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            PLC_EXPIRED.labels(op).inc()
+            raise DeadlineExpired()
+        bounded = False
+        for param, key in ((Parameter.SendTimeout, 'send'), (Parameter.RecvTimeout, 'receive')):
+            if remaining < self.timeouts[key]:
+                bounded = True
+            # Round up so a timeout that fires means the deadline really passed
+            self.client.set_param(param, math.ceil(min(remaining, self.timeouts[key]) * 1000))
+        return bounded
+    
+    def update_byte(self, byte_offset, set_mask=0, clear_mask=0, deadline=None):
+        """
+        Read-modify-write one marker byte in a single round trip pair
+        
+        Several bit changes to the same byte can be merged into one call,
+        which is how batched writers avoid one PUT per bit. The deadline is
+        checked before the read and again before the write, and snap7's
+        socket timeouts are capped at what is left of it before each call,
+        so an operation never blocks much past its deadline.
         
+        Args:
+            byte_offset: Marker byte number (%MB<n>)
+            set_mask: Bits to force to 1
+            clear_mask: Bits to force to 0 (applied before set_mask)
+            deadline: time.monotonic() value after which the operation is
+                abandoned (default: now + the 'operation' timeout)
+            
+        Returns:
+            The byte value now in the PLC, or None on error
+            
+        Raises:
+            DeadlineExpired: The deadline passed first (nothing was written)
+        """
+        is_write = bool(set_mask or clear_mask)
+        op = 'write' if is_write else 'read'
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
+        
+        start = time.perf_counter()
+        bounded = False
         try:
+            bounded = self._bound_io(deadline, op)
+            
             # Read current memory byte
             data = self.client.read_area(Areas.MK, 0, byte_offset, 1)
             current_value = data[0]
             
-            # Modify the specific bit
-            if value:
-                new_value = current_value | (1 << bit_offset)
-            else:
-                new_value = current_value & ~(1 << bit_offset)
+            # Nothing to change: this was a plain read
+            if not is_write:
+                PLC_READS.labels('ok').inc()
+                return current_value
+            
+            bounded = self._bound_io(deadline, op)
+            
+            # Modify the requested bits
+            new_value = (current_value & ~clear_mask & 0xFF) | set_mask
             
             # Write back to PLC
             data[0] = new_value
             self.client.write_area(Areas.MK, 0, byte_offset, data)
             
-            return True
+            PLC_WRITE_LATENCY.observe(time.perf_counter() - start)
+            PLC_WRITES.labels('ok').inc()
+            return new_value
             
+        except DeadlineExpired:
+            raise
         except Exception as e:
+            if bounded and time.monotonic() >= deadline:
+                # Our budget ran out mid-call; the PLC may just be slow
+                PLC_EXPIRED.labels(op).inc()
+                raise DeadlineExpired()
+            print(f"[ERROR] {op.capitalize()} failed: {e}")
+            (PLC_WRITES if is_write else PLC_READS).labels('error').inc()
+            return None
+    
+    def write_counter(self, byte_offset, value, deadline=None):
+        """
+        Write a heartbeat counter to a marker word (%MW<n>, wraps at 65536)
+        
+        Args:
+            byte_offset: First byte of the word
+            value: Counter value
+            deadline: time.monotonic() value after which the write is abandoned
+            
+        Raises:
+            DeadlineExpired: The deadline passed first
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
+        bounded = self._bound_io(deadline, 'write')
+        
+        try:
+            data = bytearray(2)
+            set_word(data, 0, value & 0xFFFF)
+            self.client.write_area(Areas.MK, 0, byte_offset, data)
+            PLC_WRITES.labels('ok').inc()
+            return True
+        except Exception as e:
+            if bounded and time.monotonic() >= deadline:
+                PLC_EXPIRED.labels('write').inc()
+                raise DeadlineExpired()
             print(f"[ERROR] Write failed: {e}")
+            PLC_WRITES.labels('error').inc()
             return False
     
-    def read_gesture(self, gesture_name):
+    def read_gesture(self, gesture_name, deadline=None):
         """
         Read a gesture state from PLC memory
         
         Args:
             gesture_name: Name of gesture
+            deadline: time.monotonic() value after which the read is abandoned
             
         Returns:
             Boolean value or None on error
@@ -125,29 +274,26 @@ class PLCCommunicator:
         area, byte_offset, bit_offset = self.gesture_addresses[gesture_name]
         
         try:
-            data = self.client.read_area(Areas.MK, 0, byte_offset, 1)
-            bit_value = bool(data[0] & (1 << bit_offset))
-            return bit_value
-            
-        except Exception as e:
-            print(f"[ERROR] Read failed: {e}")
+            byte_value = self.update_byte(byte_offset, deadline=deadline)
+        except DeadlineExpired:
+            return None
+        if byte_value is None:
             return None
+        return bool(byte_value & (1 << bit_offset))
     
-    def read_all_gestures(self):
+    def read_all_gestures(self, deadline=None):
         """Read all gesture states at once"""
         try:
-            data = self.client.read_area(Areas.MK, 0, self.byte_offset, 1)
-            byte_value = data[0]
-            
-            states = {}
-            for gesture_name, (_, _, bit_offset) in self.gesture_addresses.items():
-                states[gesture_name] = bool(byte_value & (1 << bit_offset))
-            
-            return states
-            
-        except Exception as e:
-            print(f"[ERROR] Read all failed: {e}")
+            byte_value = self.update_byte(self.byte_offset, deadline=deadline)
+        except DeadlineExpired:
+            return None
+        if byte_value is None:
             return None
+        
+        states = {}
+        for gesture_name, (_, _, bit_offset) in self.gesture_addresses.items():
+            states[gesture_name] = bool(byte_value & (1 << bit_offset))
+        return states
     
     def get_connection_state(self):
         """Check if PLC is still connected"""
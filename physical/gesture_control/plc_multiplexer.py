@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+PLC Connection Multiplexer
+Holds one snap7 connection per PLC and shares it between many local
+processes (detectors, test scripts, diagnostics) over a Unix domain
+socket. Requests that arrive together are merged so each touched marker
+byte costs one read and at most one write. A client that sets a gesture
+bit owns it until it clears it (or disconnects), so another client cannot
+release a press it did not make; a write that touches someone else's bit
+is answered BUSY. Heartbeat bits are never owned: each client's beats are
+tracked separately and the daemon drives the PLC heartbeat itself only
+while every beating client is still alive.
+
+Clients prefix each command with their remaining budget ("WITHIN <ms> ..."),
+so the daemon skips work that has expired and answers EXPIRED instead.
+
+Run one daemon per PLC:
+    python plc_multiplexer.py 192.168.2.23 /tmp/plc_mux_192.168.2.23.sock
+
+Clients use PLCMuxClient, which has the same API as PLCCommunicator.
+"""
+
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from metrics import REGISTRY
+from plc_communicator import PLC_EXPIRED, DeadlineExpired, PLCCommunicator
+
+DEFAULT_SOCKET_PATH = '/tmp/plc_mux.sock'
+DEFAULT_TCP_PORT = 5010  # Used where AF_UNIX is unavailable (Windows CPython)
+RECONNECT_INTERVAL = 2.0  # seconds between PLC reconnect attempts
+REPLY_GRACE = 0.05  # seconds a client waits past its deadline for the daemon's answer
+
+MUX_CLIENTS = REGISTRY.gauge('plc_mux_clients', 'Local clients attached to the multiplexer')
+MUX_REQUESTS = REGISTRY.counter('plc_mux_requests_total', 'Client requests handled by the multiplexer', ('op',))
+MUX_BATCHES = REGISTRY.counter('plc_mux_batches_total', 'Merged request batches sent to the PLC')
+MUX_REJECTED = REGISTRY.counter('plc_mux_ownership_rejected_total', 'Writes refused because another client owns the bit')
+MUX_STALLED = REGISTRY.gauge('plc_mux_stalled_clients', 'Beating clients whose heartbeat has stalled')
+
+
+class BitsOwned(PermissionError):
+    """Raised when a write touches a bit another multiplexer client owns"""
+
+
+def _mux_address(config, socket_path=None):
+    """Resolve (family, address) for the daemon from config and platform"""
+    mux_config = config.get('multiplexer', {})
+    if hasattr(socket, 'AF_UNIX'):
+        return socket.AF_UNIX, socket_path or mux_config.get('socket_path', DEFAULT_SOCKET_PATH)
+    return socket.AF_INET, ('127.0.0.1', mux_config.get('tcp_port', DEFAULT_TCP_PORT))
+
+
+class _Request:
+    __slots__ = ('client_id', 'op', 'byte_offset', 'bit_offset', 'set_mask', 'clear_mask',
+                 'deadline', 'done', 'response')
+
+    def __init__(self, client_id, op, byte_offset=0, bit_offset=None, set_mask=0, clear_mask=0):
+        self.client_id = client_id
+        self.op = op
+        self.byte_offset = byte_offset
+        self.bit_offset = bit_offset
+        self.set_mask = set_mask
+        self.clear_mask = clear_mask
+        self.deadline = None  # time.monotonic() after which the client no longer waits
+        self.done = threading.Event()
+        self.response = None
+
+    def reply(self, response):
+        self.response = response
+        self.done.set()
+
+
+class PLCMultiplexer:
+    def __init__(self, ip='192.168.2.23', rack=0, slot=1, config_file='gesture_config.json',
+                 socket_path=None):
+        """
+        Initialize the multiplexer daemon
+
+        Args:
+            ip: PLC IP address
+            rack: PLC rack number (usually 0)
+            slot: PLC slot number (usually 1 for CPU)
+            config_file: Path to gesture configuration JSON
+            socket_path: Unix socket path (overrides config)
+        """
+        self.plc = PLCCommunicator(ip=ip, rack=rack, slot=slot, config_file=config_file)
+        self.family, self.address = _mux_address(self.plc.config, socket_path)
+
+        self.requests = queue.Queue()
+        self.owners = {}        # (byte, bit) -> client id, only while the bit is set
+        self.client_count = 0
+        self.owner_lock = threading.Lock()
+        self.running = False
+        self.server_socket = None
+        self.last_reconnect = 0.0
+
+        # Heartbeat: clients' beats are absorbed here and the daemon beats for all of them
+        heartbeat = self.plc.config.get('heartbeat', {})
+        self.hb_enabled = heartbeat.get('enabled', False)
+        self.hb_mode = heartbeat.get('mode', 'bit')
+        self.hb_byte = heartbeat.get('byte', 0)
+        self.hb_mask = 1 << heartbeat.get('bit', 7)
+        self.hb_period = heartbeat.get('period', 0.25)
+        self.hb_stall = self.hb_period * heartbeat.get('stall_periods', 4)
+        self.hb_level = False     # Last level written to the heartbeat bit
+        self.hb_count = 0
+        self.hb_due = 0.0
+        self.beats = {}           # client id -> monotonic time of its last beat
+
+    def start(self):
+        """Connect to the PLC and start serving clients"""
+        if not self.plc.connect():
+            return False
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)  # Stale socket from a previous run
+
+        self.server_socket = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(self.address)
+        self.server_socket.listen()
+        self.running = True
+
+        threading.Thread(target=self._io_loop, name='mux-io', daemon=True).start()
+        threading.Thread(target=self._accept_loop, name='mux-accept', daemon=True).start()
+        print(f"[MUX] Serving PLC {self.plc.ip} on {self.address}")
+        return True
+
+    def stop(self):
+        """Stop serving and disconnect from the PLC"""
+        self.running = False
+        self.requests.put(None)  # Wake the I/O thread
+        if self.server_socket:
+            self.server_socket.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.plc.disconnect()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server_socket.accept()
+            except OSError:
+                break
+            self.client_count += 1
+            client_id = self.client_count
+            threading.Thread(target=self._serve_client, args=(conn, client_id),
+                             name=f'mux-client-{client_id}', daemon=True).start()
+
+    def _serve_client(self, conn, client_id):
+        print(f"[MUX] Client#{client_id} connected")
+        MUX_CLIENTS.inc()
+        reader = conn.makefile('rb')
+        try:
+            for line in reader:
+                request = self._parse(client_id, line.decode().strip())
+                if isinstance(request, str):
+                    response = request  # Parse error
+                else:
+                    MUX_REQUESTS.labels(request.op).inc()
+                    self.requests.put(request)
+                    request.done.wait()
+                    response = request.response
+                conn.sendall((response + "\n").encode())
+        except OSError as e:
+            print(f"[MUX] Client#{client_id} error: {e}")
+        finally:
+            reader.close()
+            conn.close()
+            MUX_CLIENTS.dec()
+            self.beats.pop(client_id, None)
+            self._release(client_id)
+            print(f"[MUX] Client#{client_id} disconnected")
+
+    def _parse(self, client_id, command):
+        """Turn a protocol line into a _Request, or an error string"""
+        parts = command.split()
+        if not parts:
+            return "ERROR: Empty command"
+
+        # Optional budget prefix: WITHIN <ms> <command>
+        deadline = None
+        if parts[0].upper() == "WITHIN":
+            try:
+                deadline = time.monotonic() + int(parts[1]) / 1000.0
+            except (IndexError, ValueError):
+                return "ERROR: Invalid budget (need: WITHIN MS COMMAND)"
+            parts = parts[2:]
+            if not parts:
+                return "ERROR: Empty command"
+
+        request = self._parse_command(client_id, parts)
+        if not isinstance(request, str):
+            request.deadline = deadline
+        return request
+
+    def _parse_command(self, client_id, parts):
+        """Turn the tokens of one command into a _Request, or an error string"""
+        action = parts[0].upper()
+        try:
+            if action == "STATE":
+                return _Request(client_id, 'state')
+            if len(parts) < 3 or parts[1].upper() != "M":
+                return "ERROR: Invalid command format (need: ACTION M BYTE [BIT] [VALUE])"
+            byte_offset = int(parts[2])
+            if action == "READB":
+                return _Request(client_id, 'read', byte_offset)
+            if action == "WRITEW" and len(parts) >= 4:
+                return _Request(client_id, 'word', byte_offset, None, int(parts[3]) & 0xFFFF)
+            if action == "UPDATE" and len(parts) >= 5:
+                set_mask, clear_mask = int(parts[3]), int(parts[4])
+                if not (0 <= set_mask <= 0xFF and 0 <= clear_mask <= 0xFF):
+                    return "ERROR: Masks must be 0-255"
+                op = 'write' if set_mask or clear_mask else 'read'
+                return _Request(client_id, op, byte_offset, None, set_mask, clear_mask)
+
+            if len(parts) < 4:
+                return "ERROR: Missing bit offset"
+            bit_offset = int(parts[3])
+            if not 0 <= bit_offset <= 7:
+                return f"ERROR: Bit offset must be 0-7, got {bit_offset}"
+            if action == "READ":
+                return _Request(client_id, 'read', byte_offset, bit_offset)
+            if action == "WRITE" and len(parts) >= 5:
+                mask = 1 << bit_offset
+                if parts[4] == "1" or parts[4].upper() == "TRUE":
+                    return _Request(client_id, 'write', byte_offset, bit_offset, set_mask=mask)
+                return _Request(client_id, 'write', byte_offset, bit_offset, clear_mask=mask)
+        except ValueError:
+            return "ERROR: Invalid number format in command"
+
+        return "ERROR: Unknown command (use READ, READB, WRITE, UPDATE, WRITEW or STATE)"
+
+    def _claim(self, request):
+        """A client owns a bit from setting it until it clears it"""
+        if request.client_id is None:
+            return True  # Internal cleanup write
+        bits = request.set_mask | request.clear_mask
+        with self.owner_lock:
+            keys = [(request.byte_offset, bit) for bit in range(8) if bits & (1 << bit)]
+            if any(self.owners.get(key, request.client_id) != request.client_id for key in keys):
+                return False
+            for key in keys:
+                if request.set_mask & (1 << key[1]):
+                    self.owners[key] = request.client_id
+                else:
+                    self.owners.pop(key, None)
+        return True
+
+    def _unclaim(self, requests):
+        """Give back bits claimed by writes that never reached the PLC"""
+        with self.owner_lock:
+            for request in requests:
+                if request.client_id is None:
+                    continue
+                for bit in range(8):
+                    key = (request.byte_offset, bit)
+                    if request.set_mask & (1 << bit) and self.owners.get(key) == request.client_id:
+                        del self.owners[key]
+
+    def _absorb_heartbeat(self, request):
+        """
+        Record a client's heartbeat and strip it from the request
+
+        Returns:
+            True if nothing is left to send to the PLC for this request
+        """
+        if not self.hb_enabled or request.client_id is None:
+            return False
+        if request.op == 'word':
+            if self.hb_mode != 'counter' or request.byte_offset != self.hb_byte:
+                return False
+            self.beats[request.client_id] = time.monotonic()
+            return True
+        if (request.op == 'write' and self.hb_mode == 'bit' and request.byte_offset == self.hb_byte
+                and (request.set_mask | request.clear_mask) & self.hb_mask):
+            self.beats[request.client_id] = time.monotonic()
+            request.set_mask &= ~self.hb_mask
+            request.clear_mask &= ~self.hb_mask
+            if not (request.set_mask or request.clear_mask):
+                if request.bit_offset is not None:
+                    return True  # Plain WRITE of the heartbeat bit
+                request.op = 'read'  # Beat only: reply with the byte value
+        return False
+
+    def _heartbeat(self):
+        """Beat on behalf of all clients, unless one of them has stalled"""
+        now = time.monotonic()
+        if not self.hb_enabled or not self.beats or now < self.hb_due:
+            return
+        self.hb_due = now + self.hb_period
+
+        stalled = sum(1 for last in list(self.beats.values()) if now - last > self.hb_stall)
+        MUX_STALLED.set(stalled)
+        if stalled or self.plc.get_connection_state() != "CONNECTED":
+            return  # Let the PLC watchdog see the stall
+
+        try:
+            if self.hb_mode == 'counter':
+                if self.plc.write_counter(self.hb_byte, self.hb_count + 1):
+                    self.hb_count = (self.hb_count + 1) & 0xFFFF
+            else:
+                level = not self.hb_level
+                if self.plc.update_byte(self.hb_byte, self.hb_mask if level else 0,
+                                        0 if level else self.hb_mask) is not None:
+                    self.hb_level = level
+        except DeadlineExpired:
+            pass  # Retried next period
+
+    def _release(self, client_id):
+        """Drop a departed client's bits and clear any it left set"""
+        with self.owner_lock:
+            owned = [key for key, owner in self.owners.items() if owner == client_id]
+            for key in owned:
+                del self.owners[key]
+
+        for byte_offset, bit_offset in owned:
+            self.requests.put(_Request(None, 'write', byte_offset, clear_mask=1 << bit_offset))
+
+    def _io_loop(self):
+        """Single owner of the snap7 client: drain, merge, execute"""
+        while self.running:
+            try:
+                first = self.requests.get(timeout=self.hb_period if self.hb_enabled else None)
+            except queue.Empty:
+                self._heartbeat()
+                continue
+            if first is None:
+                break
+            batch = [first]
+            while True:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.running = False
+                    break
+                batch.append(request)
+            self._execute(batch)
+            self._heartbeat()
+
+    def _execute(self, batch):
+        state = self.plc.get_connection_state()
+        if state != "CONNECTED":
+            now = time.monotonic()
+            if now - self.last_reconnect >= RECONNECT_INTERVAL:
+                self.last_reconnect = now
+                self.plc.connect()
+                state = self.plc.get_connection_state()
+
+        # Group by marker byte; later writes to the same bit win
+        per_byte = {}
+        now = time.monotonic()
+        for request in batch:
+            if request.op == 'state':
+                request.reply(state)
+                continue
+            if state != "CONNECTED":
+                request.reply("ERROR: PLC not connected")
+                continue
+            if request.deadline is not None and now > request.deadline:
+                request.reply("EXPIRED")  # Waited out its budget in the queue
+                continue
+            if self._absorb_heartbeat(request):
+                request.reply("OK")
+                continue
+            if request.op == 'word':
+                # Whole-word writes (heartbeat counters) are not merged
+                try:
+                    request.reply("OK" if self.plc.write_counter(request.byte_offset, request.set_mask,
+                                                                 deadline=request.deadline)
+                                  else "ERROR: PLC I/O failed")
+                except DeadlineExpired:
+                    request.reply("EXPIRED")
+                continue
+            if request.op == 'write' and not self._claim(request):
+                MUX_REJECTED.inc()
+                request.reply("BUSY")
+                continue
+
+            masks = per_byte.setdefault(request.byte_offset, [0, 0, []])
+            if request.op == 'write':
+                masks[0] = (masks[0] & ~request.clear_mask) | request.set_mask
+                masks[1] = (masks[1] & ~request.set_mask) | request.clear_mask
+            masks[2].append(request)
+
+        if per_byte:
+            MUX_BATCHES.inc()
+
+        # One read (and at most one write) per touched byte, within the tightest budget
+        for byte_offset, (set_mask, clear_mask, requests) in per_byte.items():
+            deadlines = [r.deadline for r in requests if r.deadline is not None]
+            try:
+                byte_value = self.plc.update_byte(byte_offset, set_mask, clear_mask,
+                                                  deadline=min(deadlines) if deadlines else None)
+            except DeadlineExpired:
+                self._unclaim(requests)
+                for request in requests:
+                    request.reply("EXPIRED")
+                continue
+            if byte_value is None:
+                self._unclaim(requests)
+            for request in requests:
+                if byte_value is None:
+                    request.reply("ERROR: PLC I/O failed")
+                elif request.op == 'write' and request.bit_offset is not None:
+                    request.reply("OK")
+                elif request.bit_offset is None:
+                    request.reply(str(byte_value))
+                else:
+                    request.reply("1" if byte_value & (1 << request.bit_offset) else "0")
+
+
+class PLCMuxClient(PLCCommunicator):
+    def __init__(self, config_file='gesture_config.json', socket_path=None):
+        """
+        Drop-in replacement for PLCCommunicator that talks to a local
+        PLCMultiplexer instead of opening its own S7 connection
+
+        Args:
+            config_file: Path to gesture configuration JSON
+            socket_path: Daemon socket path (overrides config)
+        """
+        self.load_config(config_file)
+        self.family, self.address = _mux_address(self.config, socket_path)
+        self.ip = str(self.address)
+        self.sock = None
+        self.rx_buffer = b""
+        self.pending_replies = 0  # Replies still owed for timed-out requests
+        self.connected_once = False
+
+    def _read_line(self, wait_until):
+        """Read one response line, waiting no later than wait_until"""
+        while b"\n" not in self.rx_buffer:
+            remaining = wait_until - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("multiplexer did not answer in time")
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("multiplexer closed the connection")
+            self.rx_buffer += chunk
+        line, self.rx_buffer = self.rx_buffer.split(b"\n", 1)
+        return line.decode().strip()
+
+    def _request(self, command, deadline=None):
+        """
+        Send one protocol line with the remaining budget and return the response line
+
+        The daemon uses the budget to skip expired work and answer EXPIRED.
+        An answer that still arrives late is skipped on the next call; the
+        connection stays up, so the daemon keeps this client's bits as they are.
+
+        Raises:
+            DeadlineExpired: No answer before the deadline
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
+
+        # Discard late replies to requests that already expired
+        while self.pending_replies:
+            try:
+                self._read_line(deadline)
+            except socket.timeout:
+                raise DeadlineExpired()
+            self.pending_replies -= 1
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExpired()
+        try:
+            self.sock.settimeout(self.timeouts['send'])
+            self.sock.sendall(f"WITHIN {max(1, int(remaining * 1000))} {command}\n".encode())
+        except socket.timeout:
+            # Partial sends corrupt the command stream
+            self.disconnect()
+            raise ConnectionError("multiplexer did not accept the request")
+        try:
+            return self._read_line(deadline + REPLY_GRACE)
+        except socket.timeout:
+            self.pending_replies += 1
+            raise DeadlineExpired()
+
+    def connect(self):
+        """Attach to the local multiplexer daemon"""
+        try:
+            print(f"[CONNECT] Connecting to PLC multiplexer at {self.address}...")
+            self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeouts['connect'])
+            self.sock.connect(self.address)
+            self.rx_buffer = b""
+            self.pending_replies = 0
+            print(f"[SUCCESS] Attached to multiplexer (PLC {self._request('STATE')})")
+            self.connected_once = True
+            return True
+        except Exception as e:
+            print(f"[ERROR] Connection failed: {e}")
+            self.sock = None
+            return False
+
+    def disconnect(self):
+        """Detach from the multiplexer (the PLC connection stays up)"""
+        try:
+            if self.sock:
+                self.sock.close()
+                self.sock = None
+                print("[DISCONNECT] Detached from multiplexer")
+        except Exception as e:
+            print(f"[ERROR] Disconnect error: {e}")
+
+    def update_byte(self, byte_offset, set_mask=0, clear_mask=0, deadline=None):
+        """Apply bit changes through the daemon; returns the byte value or None
+
+        Raises DeadlineExpired if the deadline passes first, and BitsOwned
+        if another client owns a bit the write touches.
+        """
+        op = 'write' if set_mask or clear_mask else 'read'
+        if self.sock is None:
+            print(f"[ERROR] {op.capitalize()} failed: not attached to multiplexer")
+            return None
+        try:
+            response = self._request(f"UPDATE M {byte_offset} {set_mask} {clear_mask}", deadline)
+        except TimeoutError:
+            PLC_EXPIRED.labels(op).inc()
+            raise DeadlineExpired()
+        except Exception as e:
+            print(f"[ERROR] {op.capitalize()} failed: {e}")
+            return None
+        if response == "EXPIRED":
+            PLC_EXPIRED.labels(op).inc()
+            raise DeadlineExpired()
+        if response == "BUSY":
+            raise BitsOwned(f"MB{byte_offset} bits owned by another client")
+        try:
+            return int(response)
+        except ValueError:
+            print(f"[ERROR] {op.capitalize()} failed: {response}")
+            return None
+
+    def write_counter(self, byte_offset, value, deadline=None):
+        """Write a heartbeat counter word through the daemon"""
+        if self.sock is None:
+            print("[ERROR] Write failed: not attached to multiplexer")
+            return False
+        try:
+            response = self._request(f"WRITEW M {byte_offset} {value & 0xFFFF}", deadline)
+        except TimeoutError:
+            PLC_EXPIRED.labels('write').inc()
+            raise DeadlineExpired()
+        except Exception as e:
+            print(f"[ERROR] Write failed: {e}")
+            return False
+        if response == "EXPIRED":
+            PLC_EXPIRED.labels('write').inc()
+            raise DeadlineExpired()
+        return response == "OK"
+
+    def get_connection_state(self):
+        """State of the daemon's PLC connection"""
+        try:
+            return self._request("STATE") if self.sock else "DISCONNECTED"
+        except Exception:
+            return "DISCONNECTED"
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("  PLC Connection Multiplexer")
+    print("=" * 60)
+
+    PLC_IP = sys.argv[1] if len(sys.argv) > 1 else (
+        input("Enter PLC IP address [192.168.2.23]: ").strip() or "192.168.2.23")
+    SOCKET_PATH = sys.argv[2] if len(sys.argv) > 2 else None
+
+    mux = PLCMultiplexer(ip=PLC_IP, rack=0, slot=1, socket_path=SOCKET_PATH)
+    if not mux.start():
+        print("[ERROR] Could not connect to PLC")
+        sys.exit(1)
+
+    print("Press Ctrl+C to exit.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[SHUTDOWN] Stopping multiplexer...")
+    finally:
+        mux.stop()
+        print("[SHUTDOWN] Complete.")
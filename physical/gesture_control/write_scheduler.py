@@ -0,0 +1,444 @@
+"""
+Priority-aware PLC write scheduler
+Sits between GestureToPLC and a communicator. Gestures are queued by
+priority class, presses are rate limited with a token bucket so bursts
+cannot flood the PLC, and a high-priority gesture discards queued
+lower-priority ones so its worst-case latency does not depend on traffic.
+All PLC I/O happens on one worker thread, off the Leap callback.
+
+The same worker keeps a heartbeat going so the PLC can tell a stalled
+Python side from "no gestures": either a bit toggled every period or a
+counter incremented every period. A toggle that is due while a gesture
+write to the same byte goes out rides along in that write for free, which
+is why the default heartbeat bit is a spare bit of the gesture byte. A
+counter needs a byte of its own, so it always costs a write.
+
+With a ConnectionSupervisor attached, failed writes are reported to it
+(a gesture that merely outlived its deadline is not a link failure, and
+neither is a press refused because another process holds the bit, which
+the communicator signals with PermissionError; such presses are dropped).
+Presses that fail or arrive while the link is down are handed to it for
+replay, and releases are remembered so the bits are cleared as soon as
+the link returns. A replayed press keeps its detection time and is only
+written within replay_max_age of it; if the replay fails too, it is
+dropped rather than held again.
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+from metrics import REGISTRY
+
+# Highest priority first
+PRIORITY_CLASSES = ('critical', 'high', 'normal', 'low')
+DEFAULT_CLASS = 'normal'
+
+QUEUE_DELAY = REGISTRY.summary('gesture_queue_delay_seconds', 'Time from submit to PLC write by priority class', ('priority',))
+QUEUE_DEPTH = REGISTRY.gauge('gesture_queue_depth', 'Gestures waiting for the PLC by priority class', ('priority',))
+PREEMPTED = REGISTRY.counter('gestures_preempted_total', 'Queued gestures discarded for a higher-priority one', ('priority',))
+OVERFLOWED = REGISTRY.counter('gestures_queue_overflow_total', 'Queued gestures discarded because the class queue was full', ('priority',))
+EXPIRED = REGISTRY.counter('gestures_expired_in_queue_total', 'Gestures that went stale before the PLC write', ('priority',))
+BUSY = REGISTRY.counter('gestures_busy_dropped_total', 'Presses dropped because another client holds the bit', ('priority',))
+RATE_LIMITED = REGISTRY.counter('plc_writes_rate_limited_total', 'Times a write waited for a rate-limit token')
+HEARTBEATS = REGISTRY.counter('plc_heartbeats_total', 'Heartbeats written, by whether they shared a gesture write', ('coalesced',))
+HEARTBEAT_FAILURES = REGISTRY.counter('plc_heartbeat_failures_total', 'Heartbeat writes that failed')
+
+
+class _Pending:
+    __slots__ = ('gesture', 'detected_at', 'submitted_at', 'on_done', 'replay')
+
+    def __init__(self, gesture, detected_at, submitted_at, on_done=None, replay=False):
+        self.gesture = gesture
+        self.detected_at = detected_at
+        self.submitted_at = submitted_at
+        self.on_done = on_done
+        self.replay = replay  # Held during an outage; never held a second time
+
+    def done(self, sent):
+        if self.on_done:
+            self.on_done(sent)
+
+
+class WriteScheduler:
+    def __init__(self, plc, priorities=None, rate_limit=20.0, burst=5, hold_time=0.1,
+                 max_queue=8, max_gesture_age=0.5, heartbeat=None, supervisor=None):
+        """
+        Initialize the scheduler for one PLC
+
+        Args:
+            plc: Communicator with update_byte() and write_counter()
+            priorities: Dict of gesture name -> priority class
+            rate_limit: Sustained gesture presses per second
+            burst: Presses allowed back-to-back before the rate limit applies
+            hold_time: Seconds a gesture bit stays high before release
+            max_queue: Queued gestures per class before the oldest is dropped
+            max_gesture_age: Seconds after detection a gesture is still worth sending
+            heartbeat: Dict with enabled / mode ('bit' or 'counter') / byte /
+                bit / period; see the "heartbeat" config section
+            supervisor: Optional ConnectionSupervisor for reconnect and replay
+        """
+        self.plc = plc
+        self.priorities = dict(priorities or {})
+        for gesture, cls in self.priorities.items():
+            if cls not in PRIORITY_CLASSES:
+                raise ValueError(f"Unknown priority class '{cls}' for {gesture}")
+        self.rate_limit = float(rate_limit)
+        self.burst = float(burst)
+        self.hold_time = hold_time
+        self.max_gesture_age = max_gesture_age
+
+        self.queues = {cls: deque(maxlen=max_queue) for cls in PRIORITY_CLASSES}
+        self.releases = []        # heap of (due, gesture)
+        self.release_due = {}     # gesture -> due time of its pending release
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+
+        heartbeat = heartbeat or {}
+        self.hb_enabled = heartbeat.get('enabled', False)
+        self.hb_mode = heartbeat.get('mode', 'bit')
+        if self.hb_mode not in ('bit', 'counter'):
+            raise ValueError(f"Unknown heartbeat mode '{self.hb_mode}'")
+        self.hb_byte = heartbeat.get('byte', 0)
+        self.hb_mask = 1 << heartbeat.get('bit', 7)
+        self.hb_period = heartbeat.get('period', 0.25)
+        self.hb_level = False     # Current heartbeat bit level
+        self.hb_count = 0         # Current heartbeat counter value
+        self.hb_due = time.monotonic()
+        if self.hb_enabled:
+            self._check_heartbeat_address()
+            if self.hb_mode == 'counter' and getattr(plc, 'legacy_bridge', False):
+                print("[HEARTBEAT] Bridge has no WRITEB (rebuild PLCSIMBridge); counter heartbeat disabled")
+                self.hb_enabled = False
+
+        self.supervisor = supervisor
+        self.unreleased = set()   # Bits whose release failed while the link was down
+        if supervisor:
+            supervisor.on_recover = self._on_recover
+
+        self.cond = threading.Condition()
+        self.running = False
+        self.worker = None
+
+    def _check_heartbeat_address(self):
+        """Refuse a heartbeat address that would overwrite gesture bits"""
+        if self.hb_mode == 'counter':
+            # Counters take whole bytes (a word on snap7, a byte on the bridge)
+            width = getattr(self.plc, 'counter_bytes', 1)
+            clash = [g for g, (_, b, _) in self.plc.gesture_addresses.items()
+                     if self.hb_byte <= b < self.hb_byte + width]
+        else:
+            bit = self.hb_mask.bit_length() - 1
+            clash = [g for g, (_, b, i) in self.plc.gesture_addresses.items()
+                     if b == self.hb_byte and i == bit]
+        if clash:
+            hint = "; give the counter a byte of its own" if self.hb_mode == 'counter' else ""
+            raise ValueError(f"Heartbeat at byte {self.hb_byte} overlaps gesture bits: {', '.join(clash)}{hint}")
+
+    @classmethod
+    def from_config(cls, plc, config, supervisor=None):
+        """Build a scheduler from the 'scheduler' config section"""
+        section = config.get('scheduler', {})
+        return cls(plc,
+                   priorities=section.get('priorities'),
+                   rate_limit=section.get('rate_limit', 20.0),
+                   burst=section.get('burst', 5),
+                   hold_time=section.get('hold_time', 0.1),
+                   max_queue=section.get('max_queue', 8),
+                   max_gesture_age=config.get('detection', {}).get('max_gesture_age', 0.5),
+                   heartbeat=config.get('heartbeat'),
+                   supervisor=supervisor)
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self._run, name='plc-writer', daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        """Stop the worker after releasing any bits still held"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.worker:
+            self.worker.join(timeout=2.0)
+        for gesture in set(self.release_due) | self.unreleased:
+            try:
+                self._write(gesture, False)
+            except PermissionError:
+                pass  # Another client holds it now
+        self.release_due.clear()
+        self.unreleased.clear()
+
+    def priority_of(self, gesture):
+        return self.priorities.get(gesture, DEFAULT_CLASS)
+
+    def submit(self, gesture, detected_at=None, on_done=None):
+        """
+        Queue a gesture press; returns immediately
+
+        Args:
+            gesture: PLC gesture name
+            detected_at: time.monotonic() of detection (default: now)
+            on_done: Called once with True when the press reached the PLC,
+                or False if it was dropped, expired or failed
+        """
+        now = time.monotonic()
+        self._enqueue(_Pending(gesture, detected_at or now, now, on_done))
+
+    def _enqueue(self, pending):
+        cls = self.priority_of(pending.gesture)
+        rank = PRIORITY_CLASSES.index(cls)
+
+        with self.cond:
+            queue = self.queues[cls]
+            if any(p.gesture == pending.gesture for p in queue):
+                pending.done(False)
+                return  # Already waiting; one press is enough
+
+            # Make way: lower classes give up their queued presses
+            for lower in PRIORITY_CLASSES[rank + 1:]:
+                dropped = self.queues[lower]
+                if dropped:
+                    PREEMPTED.labels(lower).inc(len(dropped))
+                    for pending in dropped:
+                        pending.done(False)
+                    dropped.clear()
+                    QUEUE_DEPTH.labels(lower).set(0)
+
+            if len(queue) == queue.maxlen:
+                OVERFLOWED.labels(cls).inc()
+                queue[0].done(False)
+            queue.append(pending)
+            QUEUE_DEPTH.labels(cls).set(len(queue))
+            self.cond.notify()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate_limit)
+        self.last_refill = now
+
+    def _next_press(self):
+        """Pop the highest-priority pending press (call with cond held)"""
+        for cls in PRIORITY_CLASSES:
+            queue = self.queues[cls]
+            if queue:
+                pending = queue.popleft()
+                QUEUE_DEPTH.labels(cls).set(len(queue))
+                return cls, pending
+        return None, None
+
+    def _has_presses(self):
+        return any(self.queues[cls] for cls in PRIORITY_CLASSES)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                release, press, cls, beat = None, None, None, False
+                while self.running:
+                    now = time.monotonic()
+                    self._refill(now)
+
+                    # Releases are never rate limited: a stuck bit is worse
+                    if self.releases and self.releases[0][0] <= now:
+                        due, gesture = heapq.heappop(self.releases)
+                        if self.release_due.get(gesture) == due:
+                            del self.release_due[gesture]
+                            release = gesture
+                            break
+                        continue
+
+                    if self._has_presses():
+                        if self.tokens >= 1.0:
+                            self.tokens -= 1.0
+                            cls, press = self._next_press()
+                            break
+                        RATE_LIMITED.inc()
+                        wait = (1.0 - self.tokens) / self.rate_limit
+                    else:
+                        wait = None
+
+                    if self.hb_enabled:
+                        if now >= self.hb_due:
+                            beat = True
+                            break
+                        until_beat = self.hb_due - now
+                        wait = until_beat if wait is None else min(wait, until_beat)
+
+                    if self.releases:
+                        until_release = self.releases[0][0] - now
+                        wait = until_release if wait is None else min(wait, until_release)
+                    self.cond.wait(wait)
+
+                if not self.running:
+                    return
+
+            if release is not None:
+                self._release(release)
+            elif press is not None:
+                self._press(cls, press)
+            elif beat:
+                self._beat()
+
+    def _heartbeat_masks(self, byte_offset):
+        """(set, clear) masks for a toggle that can share a write to byte_offset"""
+        if not self.hb_enabled or self.hb_mode != 'bit' or byte_offset != self.hb_byte:
+            return 0, 0
+        # Toggle early only once half a period has passed, so the PLC sees a steady rhythm
+        if time.monotonic() < self.hb_due - self.hb_period / 2:
+            return 0, 0
+        return (0, self.hb_mask) if self.hb_level else (self.hb_mask, 0)
+
+    def _beat_done(self, coalesced):
+        if self.hb_mode == 'bit':
+            self.hb_level = not self.hb_level
+        else:
+            self.hb_count += 1
+        self.hb_due = time.monotonic() + self.hb_period
+        HEARTBEATS.labels('yes' if coalesced else 'no').inc()
+
+    def _link_up(self):
+        return self.supervisor is None or self.supervisor.is_up()
+
+    def _report(self, ok):
+        if self.supervisor:
+            if ok:
+                self.supervisor.record_success()
+            else:
+                self.supervisor.record_failure()
+
+    def _on_recover(self, replay):
+        """Supervisor callback: clear stranded bits, then replay held presses"""
+        now = time.monotonic()
+        with self.cond:
+            for gesture in self.unreleased:
+                self.release_due[gesture] = now
+                heapq.heappush(self.releases, (now, gesture))
+            self.unreleased.clear()
+            self.hb_due = now
+            self.cond.notify()
+        for gesture, detected_at in replay:
+            # Keep the detection time: _press holds it to replay_max_age
+            self._enqueue(_Pending(gesture, detected_at, now, replay=True))
+
+    def _beat(self):
+        """Write a heartbeat on its own when no gesture write carried it"""
+        if not self._link_up():
+            self.hb_due = time.monotonic() + self.hb_period
+            return
+
+        try:
+            if self.hb_mode == 'bit':
+                hb_set, hb_clear = self._heartbeat_masks(self.hb_byte)
+                ok = self.plc.update_byte(self.hb_byte, hb_set, hb_clear) is not None
+            else:
+                ok = self.plc.write_counter(self.hb_byte, self.hb_count + 1)
+        except TimeoutError:
+            ok = False  # No caller deadline: the default operation timeout ran out
+        except ValueError as e:
+            # The PLC side refused the write: the link is fine, retrying will not help
+            print(f"[HEARTBEAT] Write refused ({e}); heartbeat disabled")
+            self.hb_enabled = False
+            return
+
+        self._report(ok)
+        if ok:
+            self._beat_done(coalesced=False)
+        else:
+            HEARTBEAT_FAILURES.inc()
+            self.hb_due = time.monotonic() + self.hb_period
+
+    def _release(self, gesture):
+        try:
+            if self._link_up() and self._write(gesture, False):
+                return
+        except PermissionError:
+            return  # Another client holds the bit now; it is theirs to clear
+        with self.cond:
+            if self._link_up():
+                # Transient failure: retry soon rather than leave the bit set
+                due = time.monotonic() + self.hold_time
+                self.release_due[gesture] = due
+                heapq.heappush(self.releases, (due, gesture))
+            else:
+                self.unreleased.add(gesture)
+
+    def _write(self, gesture, value, deadline=None, report=True):
+        """
+        Write one gesture bit, carrying a due heartbeat toggle along
+
+        Args:
+            report: Tell the supervisor the outcome (callers that must act
+                first report themselves)
+
+        Returns:
+            True or False, or None if the given deadline passed first
+
+        Raises:
+            PermissionError: Another client owns the bit (nothing was written)
+        """
+        _, byte_offset, bit_offset = self.plc.gesture_addresses[gesture]
+        mask = 1 << bit_offset
+        hb_set, hb_clear = self._heartbeat_masks(byte_offset)
+        set_mask = (mask if value else 0) | hb_set
+        clear_mask = (0 if value else mask) | hb_clear
+
+        try:
+            ok = self.plc.update_byte(byte_offset, set_mask, clear_mask, deadline=deadline) is not None
+        except TimeoutError:
+            if deadline is not None:
+                return None  # The gesture went stale; that says nothing about the link
+            ok = False
+        if report:
+            self._report(ok)
+        if ok and (hb_set or hb_clear):
+            self._beat_done(coalesced=True)
+        return ok
+
+    def _press(self, cls, pending):
+        now = time.monotonic()
+        # The operator opted into a longer age for replays
+        max_age = self.supervisor.replay_max_age if pending.replay else self.max_gesture_age
+        deadline = pending.detected_at + max_age
+        if now > deadline:
+            EXPIRED.labels(cls).inc()
+            pending.done(False)
+            return
+
+        if not self._link_up():
+            self._hold(pending)
+            pending.done(False)
+            return
+
+        QUEUE_DELAY.labels(cls).observe(now - pending.submitted_at)
+        try:
+            result = self._write(pending.gesture, True, deadline=deadline, report=False)
+        except PermissionError:
+            # Another detector is pressing the same gesture; the link is fine
+            BUSY.labels(cls).inc()
+            pending.done(False)
+            return
+        if result is None:
+            EXPIRED.labels(cls).inc()
+            pending.done(False)
+        elif result:
+            self._report(True)
+            print(f"[PLC] ✓ Sent {pending.gesture}")
+            due = time.monotonic() + self.hold_time
+            with self.cond:
+                self.release_due[pending.gesture] = due
+                heapq.heappush(self.releases, (due, pending.gesture))
+            pending.done(True)
+        else:
+            print(f"[PLC] ✗ Failed to send {pending.gesture}")
+            if self.supervisor:
+                # Often the failure that reveals an outage: keep it for replay,
+                # before reporting so a quick reconnect cannot miss it
+                self._hold(pending)
+            self._report(False)
+            pending.done(False)
+
+    def _hold(self, pending):
+        """Hand a press to the supervisor for replay, unless it already was a replay"""
+        if pending.replay:
+            self.supervisor.drop('replay_failed')
+        else:
+            self.supervisor.hold(pending.gesture, pending.detected_at)
@@ -10,12 +10,24 @@ namespace PLCSIMBridge
 {
     class Program
     {
+        // Per-connection state used by the stall watchdog
+        private class ClientState
+        {
+            public string Id = "";
+            public DateTime LastRx = DateTime.UtcNow;
+            public int WatchdogMs = 0;      // 0 = not armed
+            public bool Stalled = false;
+            public Dictionary<int, byte> SetBits = new Dictionary<int, byte>();
+        }
+
         private static IInstance plcInstance = null;
         private static TcpListener server = null;
         private static bool running = true;
         private static Dictionary<int, string> markerByteMapping = new Dictionary<int, string>();
         private static string instanceName = "GestureControl"; // Default
         private static int connectedClients = 0;
+        private static readonly object plcLock = new object();
+        private static readonly List<ClientState> clients = new List<ClientState>();
 
         static void Main(string[] args)
         {
@@ -149,6 +161,9 @@ namespace PLCSIMBridge
                 Console.WriteLine($"[READY]  Waiting for Python connections...");
                 Console.WriteLine("─────────────────────────────────────────────\n");
 
+                Thread watchdogThread = new Thread(WatchdogLoop) { IsBackground = true };
+                watchdogThread.Start();
+
                 while (running)
                 {
                     if (server.Pending())
@@ -180,12 +195,15 @@ namespace PLCSIMBridge
             connectedClients++;
             string clientId = $"Client#{connectedClients}";
             string remoteEndPoint = client.Client.RemoteEndPoint.ToString();
+            ClientState state = new ClientState { Id = clientId };
+            lock (clients) clients.Add(state);
 
             Console.WriteLine($"[CONNECT] {clientId} connected from {remoteEndPoint}");
             UpdateStatusLine();
 
             NetworkStream stream = client.GetStream();
             byte[] buffer = new byte[1024];
+            StringBuilder pending = new StringBuilder();
 
             try
             {
@@ -194,14 +212,40 @@ namespace PLCSIMBridge
                     if (stream.DataAvailable)
                     {
                         int bytes = stream.Read(buffer, 0, buffer.Length);
-                        string command = Encoding.ASCII.GetString(buffer, 0, bytes).Trim();
-
-                        Console.WriteLine($"[RX] {clientId}: {command}");
-                        string response = ProcessCommand(command);
-
-                        byte[] responseBytes = Encoding.ASCII.GetBytes(response + "\n");
-                        stream.Write(responseBytes, 0, responseBytes.Length);
-                        Console.WriteLine($"[TX] {clientId}: {response}");
+                        pending.Append(Encoding.ASCII.GetString(buffer, 0, bytes));
+
+                        // One reply per newline-terminated command
+                        string text = pending.ToString();
+                        int newline;
+                        while ((newline = text.IndexOf('\n')) >= 0)
+                        {
+                            string command = text.Substring(0, newline).Trim();
+                            text = text.Substring(newline + 1);
+                            if (command.Length == 0)
+                                continue;
+
+                            state.LastRx = DateTime.UtcNow;
+                            if (state.Stalled)
+                            {
+                                state.Stalled = false;
+                                Console.WriteLine($"[WATCHDOG] {clientId} resumed");
+                            }
+
+                            string response = ProcessCommand(state, command);
+
+                            byte[] responseBytes = Encoding.ASCII.GetBytes(response + "\n");
+                            stream.Write(responseBytes, 0, responseBytes.Length);
+
+                            // Heartbeat traffic arrives several times a second; only log it on error
+                            bool quiet = command.StartsWith("UPDATE", StringComparison.OrdinalIgnoreCase) && !response.StartsWith("ERROR");
+                            if (!quiet)
+                            {
+                                Console.WriteLine($"[RX] {clientId}: {command}");
+                                Console.WriteLine($"[TX] {clientId}: {response}");
+                            }
+                        }
+                        pending.Clear();
+                        pending.Append(text);
                     }
                     Thread.Sleep(10);
                 }
@@ -212,6 +256,9 @@ namespace PLCSIMBridge
             }
             finally
             {
+                lock (clients) clients.Remove(state);
+                if (state.WatchdogMs > 0)
+                    ClearClientBits(state);
                 client.Close();
                 connectedClients--;
                 Console.WriteLine($"[DISCONNECT] {clientId} disconnected");
@@ -224,11 +271,79 @@ namespace PLCSIMBridge
             Console.WriteLine($"[STATUS] Active connections: {connectedClients}");
         }
 
-        static string ProcessCommand(string command)
+        static void WatchdogLoop()
+        {
+            while (running)
+            {
+                Thread.Sleep(50);
+
+                List<ClientState> snapshot;
+                lock (clients) snapshot = new List<ClientState>(clients);
+
+                foreach (ClientState state in snapshot)
+                {
+                    if (state.WatchdogMs <= 0 || state.Stalled)
+                        continue;
+
+                    double silentMs = (DateTime.UtcNow - state.LastRx).TotalMilliseconds;
+                    if (silentMs > state.WatchdogMs)
+                    {
+                        state.Stalled = true;
+                        Console.WriteLine($"[WATCHDOG] {state.Id} silent for {silentMs:F0}ms (limit {state.WatchdogMs}ms) - clearing its bits");
+                        ClearClientBits(state);
+                    }
+                }
+            }
+        }
+
+        static void ClearClientBits(ClientState state)
+        {
+            lock (plcLock)
+            {
+                foreach (KeyValuePair<int, byte> entry in state.SetBits)
+                {
+                    if (entry.Value == 0)
+                        continue;
+                    try
+                    {
+                        string tagName = GetTagNameForAddress("M", entry.Key);
+                        if (tagName == null)
+                            continue;
+                        byte current = plcInstance.ReadUInt8(tagName);
+                        plcInstance.WriteUInt8(tagName, (byte)(current & ~entry.Value));
+                    }
+                    catch (Exception ex)
+                    {
+                        Console.WriteLine($"[ERROR] Watchdog clear of %MB{entry.Key} failed: {ex.Message}");
+                    }
+                }
+                state.SetBits.Clear();
+            }
+        }
+
+        static void TrackBits(ClientState state, int byteOffset, byte setMask, byte clearMask)
+        {
+            // Same lock as the watchdog so a clear never races a new write
+            lock (plcLock)
+            {
+                state.SetBits.TryGetValue(byteOffset, out byte owned);
+                state.SetBits[byteOffset] = (byte)((owned & ~clearMask) | setMask);
+            }
+        }
+
+        static string ProcessCommand(ClientState state, string command)
         {
             try
             {
-                string[] parts = command.Split(' ');
+                string[] parts = command.Split(' ', StringSplitOptions.RemoveEmptyEntries);
+
+                // WATCHDOG <timeout_ms>: clear this client's bits if it goes silent
+                if (parts.Length == 2 && parts[0].ToUpper() == "WATCHDOG")
+                {
+                    state.WatchdogMs = int.Parse(parts[1]);
+                    Console.WriteLine($"[WATCHDOG] {state.Id} armed: {state.WatchdogMs}ms");
+                    return "OK";
+                }
 
                 if (parts.Length < 4)
                     return "ERROR: Invalid command format (need: ACTION AREA BYTE BIT [VALUE])";
@@ -236,12 +351,28 @@ namespace PLCSIMBridge
                 string action = parts[0].ToUpper();
                 string area = parts[1].ToUpper();
                 int byteOffset = int.Parse(parts[2]);
+
+                if (action == "UPDATE" && parts.Length >= 5)
+                {
+                    return UpdateByte(state, area, byteOffset, int.Parse(parts[3]), int.Parse(parts[4]));
+                }
+                else if (action == "WRITEB")
+                {
+                    return WriteByte(area, byteOffset, int.Parse(parts[3]));
+                }
+
                 int bitOffset = int.Parse(parts[3]);
 
                 if (action == "WRITE" && parts.Length >= 5)
                 {
                     bool value = parts[4] == "1" || parts[4].ToUpper() == "TRUE";
-                    return WriteBit(area, byteOffset, bitOffset, value);
+                    string result = WriteBit(area, byteOffset, bitOffset, value);
+                    if (result == "OK")
+                    {
+                        byte mask = (byte)(1 << bitOffset);
+                        TrackBits(state, byteOffset, value ? mask : (byte)0, value ? (byte)0 : mask);
+                    }
+                    return result;
                 }
                 else if (action == "READ")
                 {
@@ -249,7 +380,7 @@ namespace PLCSIMBridge
                 }
                 else
                 {
-                    return "ERROR: Unknown command (use READ or WRITE)";
+                    return "ERROR: Unknown command (use READ, WRITE, UPDATE, WRITEB or WATCHDOG)";
                 }
             }
             catch (FormatException)
@@ -262,6 +393,59 @@ namespace PLCSIMBridge
             }
         }
 
+        static string UpdateByte(ClientState state, string area, int byteOffset, int setMask, int clearMask)
+        {
+            try
+            {
+                string tagName = GetTagNameForAddress(area, byteOffset);
+
+                if (tagName == null)
+                    return $"ERROR: No tag mapped for %{area}B{byteOffset}";
+
+                if (setMask < 0 || setMask > 255 || clearMask < 0 || clearMask > 255)
+                    return "ERROR: Masks must be 0-255";
+
+                byte newValue;
+                lock (plcLock)
+                {
+                    byte currentValue = plcInstance.ReadUInt8(tagName);
+                    newValue = (byte)((currentValue & ~clearMask) | setMask);
+                    if (setMask != 0 || clearMask != 0)
+                        plcInstance.WriteUInt8(tagName, newValue);
+                    TrackBits(state, byteOffset, (byte)setMask, (byte)clearMask);
+                }
+                return newValue.ToString();
+            }
+            catch (Exception ex)
+            {
+                return $"ERROR: {ex.Message}";
+            }
+        }
+
+        static string WriteByte(string area, int byteOffset, int value)
+        {
+            try
+            {
+                string tagName = GetTagNameForAddress(area, byteOffset);
+
+                if (tagName == null)
+                    return $"ERROR: No tag mapped for %{area}B{byteOffset}";
+
+                if (value < 0 || value > 255)
+                    return $"ERROR: Byte value must be 0-255, got {value}";
+
+                lock (plcLock)
+                {
+                    plcInstance.WriteUInt8(tagName, (byte)value);
+                }
+                return "OK";
+            }
+            catch (Exception ex)
+            {
+                return $"ERROR: {ex.Message}";
+            }
+        }
+
         static string WriteBit(string area, int byteOffset, int bitOffset, bool value)
         {
             try
@@ -274,15 +458,18 @@ namespace PLCSIMBridge
                 if (bitOffset < 0 || bitOffset > 7)
                     return $"ERROR: Bit offset must be 0-7, got {bitOffset}";
 
-                byte currentValue = plcInstance.ReadUInt8(tagName);
+                lock (plcLock)
+                {
+                    byte currentValue = plcInstance.ReadUInt8(tagName);
 
-                byte newValue;
-                if (value)
-                    newValue = (byte)(currentValue | (1 << bitOffset));
-                else
-                    newValue = (byte)(currentValue & ~(1 << bitOffset));
+                    byte newValue;
+                    if (value)
+                        newValue = (byte)(currentValue | (1 << bitOffset));
+                    else
+                        newValue = (byte)(currentValue & ~(1 << bitOffset));
 
-                plcInstance.WriteUInt8(tagName, newValue);
+                    plcInstance.WriteUInt8(tagName, newValue);
+                }
                 return "OK";
             }
             catch (Exception ex)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Detection benchmark
+Times the live per-hand route (SDK hand -> palm filter -> 1 x 1 block ->
+detect) against the scalar if-chain it replaced, then the cost per frame
+of classifying prefilled blocks of growing size. Uses the swipe threshold
+and motion filter from gesture_config.json. Needs NumPy only - no Leap
+device or PLC.
+
+Usage: python benchmark_detection.py [frames] [hands]
+"""
+
+import json
+import sys
+import time
+from types import SimpleNamespace
+import numpy as np
+from batch_detection import BatchDetector, HandBlock, GESTURE_LABELS
+
+
+def scalar_gesture(hand, swipe_speed, poses=True):
+    """The per-hand if-chain detect_gesture used before detect_batch"""
+    if hasattr(hand, 'digits'):
+        fingers_extended = [digit.is_extended for digit in hand.digits]
+    else:
+        return "none"
+    if len(fingers_extended) < 5:
+        return "none"
+    extended_count = sum(fingers_extended)
+
+    palm_velocity = hand.palm.velocity
+    if palm_velocity:
+        speed = (palm_velocity.x**2 + palm_velocity.y**2 + palm_velocity.z**2) ** 0.5
+        if speed > swipe_speed:
+            if abs(palm_velocity.x) > abs(palm_velocity.y):
+                return "swipe_right" if palm_velocity.x > 0 else "swipe_left"
+            else:
+                return "swipe_up" if palm_velocity.y > 0 else "swipe_down"
+
+    if not poses:
+        return "none"
+    if extended_count == 1 and fingers_extended[1]:
+        return "circle" if hand.grab_strength < 0.3 else "pointing"
+    if extended_count == 2 and fingers_extended[1] and fingers_extended[2]:
+        return "peace"
+    if extended_count == 5:
+        return "open_palm"
+    return "none"
+
+
+def synthetic_block(frames, hands, seed=0):
+    """Random hands: mixed poses, roughly half of them moving fast enough to swipe"""
+    rng = np.random.default_rng(seed)
+    block = HandBlock(frames, hands)
+    block.extended[:] = rng.random((frames, hands, 5)) < 0.5
+    block.velocity[:] = rng.normal(0.0, 500.0, (frames, hands, 3))
+    block.grab_strength[:] = rng.random((frames, hands))
+    block.valid[:] = rng.random((frames, hands)) < 0.9
+    return block
+
+
+def synthetic_hands(block):
+    """SDK-like hand objects for the valid slots of a block, in frame order"""
+    hands = []
+    for frame, slot in zip(*np.nonzero(block.valid)):
+        vx, vy, vz = (float(v) for v in block.velocity[frame, slot])
+        hands.append(SimpleNamespace(
+            id=int(slot),
+            digits=[SimpleNamespace(is_extended=bool(e)) for e in block.extended[frame, slot]],
+            palm=SimpleNamespace(velocity=SimpleNamespace(x=vx, y=vy, z=vz),
+                                 position=SimpleNamespace(x=0.0, y=200.0, z=0.0)),
+            grab_strength=float(block.grab_strength[frame, slot])))
+    return hands
+
+
+def time_per_hand(detector, hands):
+    """Seconds per hand for the old if-chain and for the live detect_gesture route"""
+    start = time.perf_counter()
+    for hand in hands:
+        scalar_gesture(hand, detector.swipe_speed, detector.poses)
+    scalar = (time.perf_counter() - start) / len(hands)
+
+    block = HandBlock(1, 1)
+    start = time.perf_counter()
+    for i, hand in enumerate(hands):
+        block.set_hand(0, 0, hand, detector.palm_velocity(hand, i / 120.0))
+        GESTURE_LABELS[detector.detect(block)[0, 0]]
+    live = (time.perf_counter() - start) / len(hands)
+    return scalar, live
+
+
+def slice_block(block, start, stop):
+    part = HandBlock(0, 0)
+    part.extended = block.extended[start:stop]
+    part.velocity = block.velocity[start:stop]
+    part.grab_strength = block.grab_strength[start:stop]
+    part.valid = block.valid[start:stop]
+    return part
+
+
+def time_chunks(detector, block, frames, chunk):
+    """Classify the block in chunks of frames; returns (seconds per frame, labels)"""
+    parts = [slice_block(block, i, i + chunk) for i in range(0, frames, chunk)]
+    start = time.perf_counter()
+    labels = [detector.detect(part) for part in parts]
+    elapsed = time.perf_counter() - start
+    return elapsed / frames, np.concatenate(labels)
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    hands = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    print("=" * 60)
+    print(f"  Detection benchmark: {frames} frames x {hands} hands")
+    print("=" * 60)
+
+    with open('gesture_config.json') as f:
+        detector = BatchDetector.from_config(json.load(f))
+    block = synthetic_block(frames, hands)
+    detector.detect(block)  # Warm up
+
+    scalar, live = time_per_hand(detector, synthetic_hands(block))
+    print("\n  Per hand (live path, 8333 us frame budget at 120 fps):")
+    print(f"  {'if-chain (old)':<16} {scalar * 1e6:9.3f} us/hand")
+    print(f"  {'detect_gesture':<16} {live * 1e6:9.3f} us/hand   {live / scalar:6.1f}x slower")
+
+    print("\n  Per frame, prefilled blocks:")
+    reference = None
+    for chunk in (1, 16, 256, frames):
+        per_frame, labels = time_chunks(detector, block, frames, chunk)
+        if reference is None:
+            reference, single = labels, per_frame
+        elif not np.array_equal(labels, reference):
+            print(f"[ERROR] Chunk size {chunk} disagrees with single-frame results")
+        name = "single frame" if chunk == 1 else f"batch of {chunk}"
+        print(f"  {name:<16} {per_frame * 1e6:9.3f} us/frame   {single / per_frame:8.1f}x")
+
+    counts = np.bincount(reference.ravel(), minlength=len(GESTURE_LABELS))
+    print("\n[LABELS] " + ", ".join(f"{n}: {c}" for n, c in zip(GESTURE_LABELS, counts)))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,30 @@ Detects hand gestures and sends them to PLCSIM Advanced via bridge
 
 import leap
 import time
+from functools import partial
 from typing import Dict, List
 from plc_virtual_communicator import PLCVirtualCommunicator
+from metrics import REGISTRY, start_metrics_server
+from batch_detection import BatchDetector, HandBlock, GESTURE_LABELS
+from write_scheduler import WriteScheduler
+from connection_supervisor import ConnectionSupervisor
+from multi_device import MultiDeviceListener
+
+FRAMES = REGISTRY.counter('leap_frames_total', 'Tracking frames processed', ('device',))
+FRAMES_DROPPED = REGISTRY.counter('leap_frames_dropped_total', 'Tracking frames skipped by the Leap service', ('device',))
+FPS = REGISTRY.gauge('leap_fps', 'Tracking frame rate over the session', ('device',))
+HANDS = REGISTRY.gauge('leap_hands', 'Hands in the most recent frame', ('device',))
+GESTURES = REGISTRY.counter('gestures_detected_total', 'Gestures detected by type', ('gesture',))
+GESTURES_SUPPRESSED = REGISTRY.counter('gestures_cooldown_suppressed_total', 'Gestures dropped by the cooldown', ('gesture',))
+GESTURES_STALE = REGISTRY.counter('gestures_stale_dropped_total', 'Gestures dropped for exceeding max_gesture_age', ('gesture',))
 
 
 class GestureToPLC(leap.Listener):
-    def __init__(self, plc_communicator):
+    def __init__(self, plc_communicator, scheduler=None, device='default'):
         super().__init__()
         self.plc = plc_communicator
+        self.scheduler = scheduler  # Writes inline when None
+        self.device = device  # Label for this detector's frame metrics
         
         # Frame counting
         self.frame_count = 0
@@ -23,6 +39,16 @@ class GestureToPLC(leap.Listener):
         self.last_gesture = "none"
         self.gesture_cooldown = 0.5  # 500ms between same gesture triggers
         self.last_trigger_time = {}
+        self.in_flight = set()  # Gestures handed to the scheduler and not yet done
+        self.last_frame_id = None
+        
+        # Palm smoothing and swipe threshold from config
+        config = getattr(plc_communicator, 'config', {})
+        self.detector = BatchDetector.from_config(config, poses=True)
+        self.block = HandBlock(1, 1)  # Reused for every per-frame call
+        self.max_gesture_age = config.get('detection', {}).get('max_gesture_age', 0.5)
+        self.frame_time = 0.0
+        self.frame_detected_at = time.monotonic()
         
         print("[LEAP] Gesture detector initialized")
         
@@ -39,83 +65,58 @@ class GestureToPLC(leap.Listener):
         
     def on_tracking_event(self, event):
         self.frame_count += 1
+        FRAMES.labels(self.device).inc()
+        
+        # Gaps in the service frame id mean frames we never saw
+        frame_id = getattr(event, 'tracking_frame_id', None)
+        if frame_id is not None:
+            if self.last_frame_id is not None and frame_id > self.last_frame_id + 1:
+                FRAMES_DROPPED.labels(self.device).inc(frame_id - self.last_frame_id - 1)
+            self.last_frame_id = frame_id
+        
+        # Leap timestamps are in microseconds
+        timestamp = getattr(event, 'timestamp', None)
+        self.frame_time = timestamp * 1e-6 if timestamp is not None else time.monotonic()
+        
+        # Back-date detection by how long the frame took to reach us
+        capture_age = 0.0
+        if timestamp is not None and hasattr(leap, 'get_now'):
+            capture_age = max(0.0, (leap.get_now() - timestamp) * 1e-6)
+        self.frame_detected_at = time.monotonic() - capture_age
         
         # Process each hand
         for hand in event.hands:
             gesture = self.detect_gesture(hand)
             if gesture != "none":
-                self.handle_gesture(gesture)
+                self.handle_gesture(gesture, self.frame_detected_at)
         
         # Stats every 2 seconds
         if self.frame_count % 120 == 0:
             elapsed = time.time() - self.start_time
             fps = self.frame_count / elapsed if elapsed > 0 else 0
+            FPS.labels(self.device).set(fps)
+            HANDS.labels(self.device).set(len(event.hands))
             print(f"[STATS] Frames: {self.frame_count} | FPS: {fps:.1f} | Hands: {len(event.hands)}")
     
     def detect_gesture(self, hand) -> str:
-        """Detect gestures from hand data"""
+        """Detect gestures from hand data (single-hand wrapper over detect_batch; cost vs the old if-chain: benchmark_detection.py)"""
         try:
-            # Get finger extension states
-            fingers_extended = []
-            if hasattr(hand, 'digits'):
-                fingers_extended = [digit.is_extended for digit in hand.digits]
-            elif hasattr(hand, 'fingers'):
-                fingers_extended = [finger.is_extended for finger in hand.fingers]
-            else:
-                return "none"
-            
-            if len(fingers_extended) < 5:
-                return "none"
-            
-            # Count extended fingers
-            extended_count = sum(fingers_extended)
-            
-            # Get palm direction for swipe detection
-            palm_direction = hand.palm.direction
-            palm_velocity = hand.palm.velocity if hasattr(hand.palm, 'velocity') else None
-            
-            # Swipe detection (based on palm velocity and direction)
-            if palm_velocity:
-                speed = (palm_velocity.x**2 + palm_velocity.y**2 + palm_velocity.z**2) ** 0.5
-                
-                if speed > 800:  # Fast movement threshold
-                    # Horizontal swipes
-                    if abs(palm_velocity.x) > abs(palm_velocity.y):
-                        return "swipe_right" if palm_velocity.x > 0 else "swipe_left"
-                    # Vertical swipes
-                    else:
-                        return "swipe_up" if palm_velocity.y > 0 else "swipe_down"
-            
-            # Circle gesture (fist with index finger extended, rotating)
-            # This is simplified - you can enhance based on your needs
-            if extended_count == 1 and fingers_extended[1]:  # Only index extended
-                # Could add rotation detection here
-                # For now, we'll use grab_strength as a proxy
-                if hand.grab_strength < 0.3:  # Relatively open hand
-                    return "circle"
-            
-            # Pointing (index finger only)
-            if extended_count == 1 and fingers_extended[1]:
-                return "pointing"
-            
-            # Peace sign (index and middle)
-            if extended_count == 2 and fingers_extended[1] and fingers_extended[2]:
-                return "peace"
-            
-            # Open palm (all fingers extended)
-            if extended_count == 5:
-                return "open_palm"
-            
-            return "none"
-            
+            # Smooth the palm velocity before it goes into the block
+            velocity = self.detector.palm_velocity(hand, self.frame_time)
+            self.block.set_hand(0, 0, hand, velocity)
+            code = self.detector.detect(self.block)[0, 0]
+            return str(GESTURE_LABELS[code])
+        
         except Exception as e:
             if self.frame_count % 120 == 0:  # Don't spam errors
                 print(f"[ERROR] Gesture detection: {e}")
             return "none"
     
-    def handle_gesture(self, gesture: str):
-        """Send gesture to PLC with cooldown"""
+    def handle_gesture(self, gesture: str, detected_at=None):
+        """Send gesture to PLC with cooldown, unless it has gone stale"""
         current_time = time.time()
+        if detected_at is None:
+            detected_at = time.monotonic()
         
         # Map detected gestures to PLC gestures
         gesture_map = {
@@ -132,14 +133,32 @@ class GestureToPLC(leap.Listener):
         if plc_gesture is None:
             return
         
+        # Acting on an old gesture is worse than dropping it
+        if time.monotonic() - detected_at > self.max_gesture_age:
+            GESTURES_STALE.labels(plc_gesture).inc()
+            return
+        
         # Check cooldown
         last_time = self.last_trigger_time.get(plc_gesture, 0)
         if current_time - last_time < self.gesture_cooldown:
+            GESTURES_SUPPRESSED.labels(plc_gesture).inc()
             return  # Too soon
+        if plc_gesture in self.in_flight:
+            GESTURES_SUPPRESSED.labels(plc_gesture).inc()
+            return  # Previous press still queued or being written
         
         # Trigger gesture
+        GESTURES.labels(plc_gesture).inc()
         print(f"[GESTURE] Detected: {gesture} → {plc_gesture}")
-        success = self.plc.write_gesture(plc_gesture, True)
+        if self.scheduler:
+            # Queued by priority; the PLC write happens on the scheduler thread
+            self.in_flight.add(plc_gesture)
+            self.scheduler.submit(plc_gesture, detected_at,
+                                  on_done=partial(self._on_sent, plc_gesture, current_time))
+            return
+        
+        success = self.plc.write_gesture(plc_gesture, True,
+                                         deadline=detected_at + self.max_gesture_age)
         
         if success:
             print(f"[PLC] ✓ Sent {plc_gesture}")
@@ -148,6 +167,12 @@ class GestureToPLC(leap.Listener):
             self.last_trigger_time[plc_gesture] = current_time
         else:
             print(f"[PLC] ✗ Failed to send {plc_gesture}")
+    
+    def _on_sent(self, gesture, triggered_at, sent):
+        """Scheduler callback: the cooldown only starts once the press reached the PLC"""
+        self.in_flight.discard(gesture)
+        if sent:
+            self.last_trigger_time[gesture] = triggered_at
 
 
 def main():
@@ -165,10 +190,27 @@ def main():
     
     print("[READY] PLC connection established\n")
     
+    # Optional metrics endpoint
+    metrics_config = plc.config.get('metrics', {})
+    metrics_server = None
+    if metrics_config.get('enabled'):
+        metrics_server = start_metrics_server(metrics_config.get('port', 9108),
+                                              metrics_config.get('host', '127.0.0.1'))
+    
     # Start Leap Motion tracking
     print("[INIT] Starting Leap Motion tracking...")
-    listener = GestureToPLC(plc)
-    connection = leap.Connection()
+    supervisor = ConnectionSupervisor.from_config(plc, plc.config)
+    scheduler = WriteScheduler.from_config(plc, plc.config, supervisor)
+    scheduler.start()
+    multi_device = plc.config.get('multi_device', {}).get('enabled', False)
+    if multi_device:
+        # One detection worker per controller, merged before the scheduler
+        connection = leap.Connection(multi_device_aware=True)
+        listener = MultiDeviceListener.from_config(
+            connection, lambda sink, device: GestureToPLC(plc, sink, device), scheduler, plc.config)
+    else:
+        connection = leap.Connection()
+        listener = GestureToPLC(plc, scheduler)
     connection.add_listener(listener)
     
     print("[READY] Gesture detection active")
@@ -190,7 +232,13 @@ def main():
         print(f"\n\n[ERROR] {e}")
     finally:
         connection.remove_listener(listener)
+        if multi_device:
+            listener.stop()
+        supervisor.stop()
+        scheduler.stop()
         plc.disconnect()
+        if metrics_server:
+            metrics_server.shutdown()
         print("[SHUTDOWN] Complete")
 
 
@@ -0,0 +1,206 @@
+"""
+Runtime metrics for gesture detection and PLC I/O
+Counters and gauges are updated from the tracking and I/O threads under
+a short per-metric lock; rendering to Prometheus text format only
+happens when the optional HTTP endpoint is scraped.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Counter:
+    """Monotonic counter. inc() may be called from any thread."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class Gauge:
+    """Point-in-time value. set() is a plain attribute store; inc()/dec() are locked."""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def value(self):
+        return self._value
+
+
+class Summary:
+    """Running count and sum of observations (e.g. latencies in seconds)."""
+
+    def __init__(self):
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._count += 1
+            self._sum += value
+
+    def value(self):
+        return self._count, self._sum
+
+
+class MetricFamily:
+    """A named metric with optional labels; children are created on first use."""
+
+    _types = {Counter: 'counter', Gauge: 'gauge', Summary: 'summary'}
+
+    def __init__(self, name, documentation, metric_class, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.metric_class = metric_class
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = metric_class()
+
+    def labels(self, *values):
+        """
+        Get the child metric for a set of label values
+
+        Args:
+            values: One value per label name, in declaration order
+        """
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children.setdefault(key, self.metric_class())
+        return child
+
+    # Unlabelled families forward straight to their single child
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def render(self):
+        """Render this family in Prometheus text exposition format"""
+        kind = self._types[self.metric_class]
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {kind}"]
+
+        for key, child in list(self._children.items()):
+            label_str = ""
+            if key:
+                pairs = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, key))
+                label_str = "{" + pairs + "}"
+
+            if kind == 'summary':
+                count, total = child.value()
+                lines.append(f"{self.name}_count{label_str} {count}")
+                lines.append(f"{self.name}_sum{label_str} {total}")
+            else:
+                lines.append(f"{self.name}{label_str} {child.value()}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, documentation, metric_class, labelnames):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = MetricFamily(name, documentation, metric_class, labelnames)
+                self._families[name] = family
+            return family
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, documentation, Counter, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(name, documentation, Gauge, labelnames)
+
+    def summary(self, name, documentation, labelnames=()):
+        return self._register(name, documentation, Summary, labelnames)
+
+    def render(self):
+        """Render all registered metrics in Prometheus text format"""
+        with self._lock:
+            families = list(self._families.values())
+        lines = []
+        for family in families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the detector and communicators
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+
+def start_metrics_server(port=9108, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serve metrics over HTTP from a daemon thread
+
+    Args:
+        port: TCP port for the /metrics endpoint
+        host: Bind address (localhost only by default)
+        registry: Registry to expose
+
+    Returns:
+        The running server (call shutdown() to stop), or None on error
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"[METRICS] Could not start endpoint on {host}:{port}: {e}")
+        return None
+
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    print(f"[METRICS] Serving http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,106 @@
+"""
+Palm motion smoothing
+One-Euro adaptive low-pass filter per hand and per axis. Slow movement is
+filtered heavily to remove tracking jitter; fast movement raises the cutoff
+so swipes come through with almost no lag. Each update is O(1).
+"""
+
+import math
+from array import array
+
+# Slot layout of a hand's state array: 6 axes (palm x/y/z position then
+# x/y/z velocity) x (value, derivative), followed by the last timestamp.
+AXES = 6
+STATE_SIZE = AXES * 2 + 1
+T_SLOT = AXES * 2
+
+DEFAULT_PARAMS = {
+    'position': {'min_cutoff': 1.0, 'beta': 0.05, 'd_cutoff': 1.0},
+    'velocity': {'min_cutoff': 2.0, 'beta': 0.002, 'd_cutoff': 1.0},
+}
+
+
+def _alpha(cutoff, dt):
+    """Smoothing factor for a first-order low-pass at the given cutoff (Hz)"""
+    tau = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class PalmMotionFilter:
+    def __init__(self, position=None, velocity=None, stale_after=1.0):
+        """
+        Initialize per-hand One-Euro filters
+
+        Args:
+            position: Dict of min_cutoff / beta / d_cutoff for palm position (mm)
+            velocity: Dict of min_cutoff / beta / d_cutoff for palm velocity (mm/s)
+            stale_after: Seconds without a frame before a hand's state is dropped
+        """
+        pos = dict(DEFAULT_PARAMS['position'], **(position or {}))
+        vel = dict(DEFAULT_PARAMS['velocity'], **(velocity or {}))
+        # Per-axis parameter tuples, in state slot order
+        self.params = [(pos['min_cutoff'], pos['beta'], pos['d_cutoff'])] * 3 + \
+                      [(vel['min_cutoff'], vel['beta'], vel['d_cutoff'])] * 3
+        self.stale_after = stale_after
+        self.hands = {}  # hand id -> array('d') of STATE_SIZE
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a filter from the 'motion_filter' config section, or None if disabled"""
+        section = config.get('motion_filter', {})
+        if not section.get('enabled', False):
+            return None
+        return cls(section.get('position'), section.get('velocity'),
+                   section.get('stale_after', 1.0))
+
+    def update(self, hand_id, timestamp, position, velocity):
+        """
+        Filter one frame of palm data for a hand
+
+        Args:
+            hand_id: Tracking id of the hand
+            timestamp: Frame time in seconds
+            position: (x, y, z) palm position
+            velocity: (x, y, z) palm velocity
+
+        Returns:
+            (filtered_position, filtered_velocity) as tuples
+        """
+        raw = (position[0], position[1], position[2], velocity[0], velocity[1], velocity[2])
+        state = self.hands.get(hand_id)
+
+        if state is None:
+            self._evict(timestamp)
+            state = array('d', [0.0] * STATE_SIZE)
+            for axis in range(AXES):
+                state[axis * 2] = raw[axis]
+            state[T_SLOT] = timestamp
+            self.hands[hand_id] = state
+            return raw[:3], raw[3:]
+
+        dt = timestamp - state[T_SLOT]
+        if dt <= 0.0:
+            # Duplicate or out-of-order frame: hold the last estimate
+            return tuple(state[0:6:2]), tuple(state[6:12:2])
+        state[T_SLOT] = timestamp
+
+        for axis in range(AXES):
+            min_cutoff, beta, d_cutoff = self.params[axis]
+            slot = axis * 2
+            prev = state[slot]
+
+            # Smoothed derivative drives the adaptive cutoff
+            a_d = _alpha(d_cutoff, dt)
+            dx = a_d * ((raw[axis] - prev) / dt) + (1.0 - a_d) * state[slot + 1]
+            state[slot + 1] = dx
+
+            a = _alpha(min_cutoff + beta * abs(dx), dt)
+            state[slot] = a * raw[axis] + (1.0 - a) * prev
+
+        return tuple(state[0:6:2]), tuple(state[6:12:2])
+
+    def _evict(self, now):
+        """Forget hands that have left the field of view"""
+        stale = [hid for hid, state in self.hands.items() if now - state[T_SLOT] > self.stale_after]
+        for hid in stale:
+            del self.hands[hid]
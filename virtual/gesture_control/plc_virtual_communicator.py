@@ -1,12 +1,35 @@
 import socket
 import json
 import os
+import time
+from metrics import REGISTRY
+
+PLC_CONNECTED = REGISTRY.gauge('plc_connected', 'PLC connection up (1) or down (0)')
+PLC_CONNECTS = REGISTRY.counter('plc_connect_attempts_total', 'PLC connection attempts by result', ('result',))
+PLC_RECONNECTS = REGISTRY.counter('plc_reconnects_total', 'Successful connections after the first one')
+PLC_WRITES = REGISTRY.counter('plc_writes_total', 'PLC gesture writes by result', ('result',))
+PLC_READS = REGISTRY.counter('plc_reads_total', 'PLC gesture reads by result', ('result',))
+PLC_WRITE_LATENCY = REGISTRY.summary('plc_write_latency_seconds', 'Round-trip time of successful PLC writes')
+PLC_EXPIRED = REGISTRY.counter('plc_operations_expired_total', 'PLC operations abandoned at their deadline', ('op',))
+
+# Seconds; overridden by the "timeouts" section of the config
+DEFAULT_TIMEOUTS = {'connect': 2.0, 'send': 0.5, 'receive': 0.5, 'operation': 0.25}
+
+
+class DeadlineExpired(TimeoutError):
+    """Raised when an operation's deadline passes before it is done"""
 
 class PLCVirtualCommunicator:
+    counter_bytes = 1  # write_counter() fills one %MB byte
+
     def __init__(self, ip='localhost', port=5000, config_file='gesture_config.json'):
         self.ip = ip
         self.port = port
         self.bridge_socket = None
+        self.connected_once = False
+        self.rx_buffer = b""
+        self.pending_replies = 0  # Replies still owed for timed-out requests
+        self.legacy_bridge = False  # Bridge build without UPDATE support
         
         # Load configuration
         self.load_config(config_file)
@@ -18,6 +41,8 @@ class PLCVirtualCommunicator:
         
         with open(config_file, 'r') as f:
             config = json.load(f)
+        self.config = config
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **config.get('timeouts', {}))
         
         # Get active gesture set
         active_set = config.get('active_set', 'primary')
@@ -38,12 +63,23 @@ class PLCVirtualCommunicator:
         """Connect to C# bridge"""
         try:
             print(f"Connecting to C# bridge at {self.ip}:{self.port}...")
-            self.bridge_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.bridge_socket.connect((self.ip, self.port))
+            self.bridge_socket = socket.create_connection((self.ip, self.port),
+                                                          timeout=self.timeouts['connect'])
+            self.bridge_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.rx_buffer = b""
+            self.pending_replies = 0
             print("✓ Connected to bridge")
+            self._arm_watchdog()
+            PLC_CONNECTS.labels('ok').inc()
+            PLC_CONNECTED.set(1)
+            if self.connected_once:
+                PLC_RECONNECTS.inc()
+            self.connected_once = True
             return True
         except Exception as e:
             print(f"Connection failed: {e}")
+            self.bridge_socket = None
+            PLC_CONNECTS.labels('error').inc()
             return False
     
     def disconnect(self):
@@ -51,42 +87,267 @@ class PLCVirtualCommunicator:
         try:
             if self.bridge_socket:
                 self.bridge_socket.close()
+                self.bridge_socket = None
                 print("Disconnected from bridge")
+            PLC_CONNECTED.set(0)
         except Exception as e:
             print(f"Disconnect error: {e}")
     
-    def write_gesture(self, gesture_name, value):
-        """Write a gesture state to PLC via bridge"""
+    def _arm_watchdog(self):
+        """Ask the bridge to clear our bits if our heartbeat stops"""
+        heartbeat = self.config.get('heartbeat', {})
+        if not heartbeat.get('enabled', False):
+            return
+        timeout_ms = int(heartbeat.get('period', 0.25) * heartbeat.get('stall_periods', 4) * 1000)
+        deadline = time.monotonic() + self.timeouts['connect']
+        try:
+            response = self._request(f"WATCHDOG {timeout_ms}\n", deadline)
+        except Exception as e:
+            response = str(e)
+        if response.startswith("ERROR"):
+            # Only builds without WATCHDOG refuse it (they reject any 2-token
+            # command as badly formed); they also lack UPDATE and WRITEB
+            self.legacy_bridge = True
+        if response != "OK":
+            print(f"Bridge watchdog not armed: {response}")
+    
+    def get_connection_state(self):
+        """Check if the bridge connection is still open"""
+        return "CONNECTED" if self.bridge_socket else "DISCONNECTED"
+    
+    def _drop_connection(self, reason):
+        """Close a broken socket so later calls fail fast"""
+        print(f"Bridge connection lost: {reason}")
+        try:
+            self.bridge_socket.close()
+        except Exception:
+            pass
+        self.bridge_socket = None
+        PLC_CONNECTED.set(0)
+    
+    def _remaining(self, deadline, limit):
+        """Socket timeout for the next step, bounded by the deadline"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExpired()
+        return min(remaining, limit)
+    
+    def _read_line(self, deadline):
+        """Read one reply line, waiting no later than the deadline"""
+        while b"\n" not in self.rx_buffer:
+            self.bridge_socket.settimeout(self._remaining(deadline, self.timeouts['receive']))
+            chunk = self.bridge_socket.recv(1024)
+            if not chunk:
+                raise ConnectionError("bridge closed the connection")
+            self.rx_buffer += chunk
+        line, self.rx_buffer = self.rx_buffer.split(b"\n", 1)
+        return line.decode().strip()
+    
+    def _request(self, command, deadline):
+        """
+        Send one command and return the bridge's reply
+        
+        Raises DeadlineExpired if the deadline passes first. A reply that
+        arrives after its request expired is skipped on the next call.
+        """
+        if self.bridge_socket is None:
+            raise ConnectionError("not connected")
+        
+        # Discard late replies to requests that already expired
+        while self.pending_replies:
+            try:
+                self._read_line(deadline)
+            except socket.timeout:
+                # Still owed; the connection itself is fine
+                raise DeadlineExpired()
+            self.pending_replies -= 1
+        
+        # Outside the try: expiring before the send leaves the stream intact
+        send_timeout = self._remaining(deadline, self.timeouts['send'])
+        try:
+            self.bridge_socket.settimeout(send_timeout)
+            self.bridge_socket.sendall(command.encode())
+        except socket.timeout:
+            # Partial sends corrupt the command stream
+            self._drop_connection("send timed out")
+            raise DeadlineExpired()
+        
+        try:
+            return self._read_line(deadline)
+        except (socket.timeout, DeadlineExpired):
+            self.pending_replies += 1
+            raise DeadlineExpired()
+    
+    def write_gesture(self, gesture_name, value, deadline=None):
+        """
+        Write a gesture state to PLC via bridge
+        
+        Args:
+            gesture_name: Name of gesture (e.g., 'swipe_left')
+            value: Boolean value (True/False)
+            deadline: time.monotonic() value after which the write is
+                abandoned (default: now + the 'operation' timeout)
+        """
         if gesture_name not in self.gesture_addresses:
             print(f"Unknown gesture: {gesture_name}")
             return False
         
         area, byte_offset, bit_offset = self.gesture_addresses[gesture_name]
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
         
+        start = time.perf_counter()
         try:
             command = f"WRITE {area} {byte_offset} {bit_offset} {1 if value else 0}\n"
-            self.bridge_socket.sendall(command.encode())
-            response = self.bridge_socket.recv(1024).decode().strip()
-            return response == "OK"
+            response = self._request(command, deadline)
+        except DeadlineExpired:
+            PLC_EXPIRED.labels('write').inc()
+            return False
         except Exception as e:
             print(f"Write error: {e}")
+            if self.bridge_socket:
+                self._drop_connection(e)
+            PLC_WRITES.labels('error').inc()
+            return False
+
+        if response == "OK":
+            PLC_WRITE_LATENCY.observe(time.perf_counter() - start)
+            PLC_WRITES.labels('ok').inc()
+            return True
+        PLC_WRITES.labels('error').inc()
+        return False
+    
+    def update_byte(self, byte_offset, set_mask=0, clear_mask=0, deadline=None):
+        """
+        Change several bits of one marker byte in a single bridge round trip
+        
+        Args:
+            byte_offset: Marker byte number (%MB<n>)
+            set_mask: Bits to force to 1
+            clear_mask: Bits to force to 0 (applied before set_mask)
+            deadline: time.monotonic() value after which the operation is
+                abandoned (default: now + the 'operation' timeout)
+            
+        Returns:
+            The byte value now in the PLC, or None on error.
+            Older bridges without UPDATE get one WRITE per changed bit
+            (returning only set_mask) or, for a plain read, one READ per bit.
+            
+        Raises:
+            DeadlineExpired: The deadline passed first
+        """
+        is_write = bool(set_mask or clear_mask)
+        op = 'write' if is_write else 'read'
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
+        
+        start = time.perf_counter()
+        try:
+            if self.legacy_bridge:
+                return self._update_bits_legacy(byte_offset, set_mask, clear_mask, deadline)
+            response = self._request(f"UPDATE M {byte_offset} {set_mask} {clear_mask}\n", deadline)
+            if response.startswith("ERROR: Unknown command"):
+                print("Bridge does not support UPDATE; falling back to per-bit WRITE")
+                self.legacy_bridge = True
+                return self._update_bits_legacy(byte_offset, set_mask, clear_mask, deadline)
+            value = int(response)
+        except DeadlineExpired:
+            PLC_EXPIRED.labels(op).inc()
+            raise
+        except ValueError as e:
+            print(f"Update error: {e}")
+            (PLC_WRITES if is_write else PLC_READS).labels('error').inc()
+            return None
+        except Exception as e:
+            print(f"Update error: {e}")
+            if self.bridge_socket:
+                self._drop_connection(e)
+            (PLC_WRITES if is_write else PLC_READS).labels('error').inc()
+            return None
+        
+        if is_write:
+            PLC_WRITE_LATENCY.observe(time.perf_counter() - start)
+            PLC_WRITES.labels('ok').inc()
+        else:
+            PLC_READS.labels('ok').inc()
+        return value
+    
+    def _update_bits_legacy(self, byte_offset, set_mask, clear_mask, deadline):
+        """One WRITE command per changed bit, for bridges without UPDATE"""
+        if not (set_mask or clear_mask):
+            value = 0
+            for bit_offset in range(8):
+                response = self._request(f"READ M {byte_offset} {bit_offset}\n", deadline)
+                if response not in ("0", "1"):
+                    raise ValueError(response)
+                value |= int(response) << bit_offset
+            PLC_READS.labels('ok').inc()
+            return value
+        
+        for bit_offset in range(8):
+            mask = 1 << bit_offset
+            if (set_mask | clear_mask) & mask:
+                value = 1 if set_mask & mask else 0
+                response = self._request(f"WRITE M {byte_offset} {bit_offset} {value}\n", deadline)
+                if response != "OK":
+                    raise ValueError(response)
+        PLC_WRITES.labels('ok').inc()
+        return set_mask
+    
+    def write_counter(self, byte_offset, value, deadline=None):
+        """
+        Write a heartbeat counter to a whole marker byte (wraps at 256)
+        
+        Raises:
+            DeadlineExpired: The deadline passed first
+            ValueError: The bridge refused the write (the link itself is fine)
+        """
+        if self.legacy_bridge:
+            raise ValueError("bridge has no WRITEB; rebuild PLCSIMBridge for counter heartbeats")
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
+        try:
+            response = self._request(f"WRITEB M {byte_offset} {value & 0xFF}\n", deadline)
+        except DeadlineExpired:
+            PLC_EXPIRED.labels('write').inc()
+            raise
+        except Exception as e:
+            print(f"Write error: {e}")
+            if self.bridge_socket:
+                self._drop_connection(e)
+            PLC_WRITES.labels('error').inc()
             return False
+        if response.startswith("ERROR"):
+            PLC_WRITES.labels('error').inc()
+            if response.startswith("ERROR: Unknown command"):
+                self.legacy_bridge = True
+            raise ValueError(response)
+        PLC_WRITES.labels('ok' if response == "OK" else 'error').inc()
+        return response == "OK"
     
-    def read_gesture(self, gesture_name):
+    def read_gesture(self, gesture_name, deadline=None):
         """Read a gesture state from PLC via bridge"""
         if gesture_name not in self.gesture_addresses:
             print(f"Unknown gesture: {gesture_name}")
             return None
         
         area, byte_offset, bit_offset = self.gesture_addresses[gesture_name]
+        if deadline is None:
+            deadline = time.monotonic() + self.timeouts['operation']
         
         try:
             command = f"READ {area} {byte_offset} {bit_offset}\n"
-            self.bridge_socket.sendall(command.encode())
-            response = self.bridge_socket.recv(1024).decode().strip()
+            response = self._request(command, deadline)
+            PLC_READS.labels('ok').inc()
             return response == "1"
+        except DeadlineExpired:
+            PLC_EXPIRED.labels('read').inc()
+            return None
         except Exception as e:
             print(f"Read error: {e}")
+            if self.bridge_socket:
+                self._drop_connection(e)
+            PLC_READS.labels('error').inc()
             return None
 
 # Test the communicator
@@ -0,0 +1,103 @@
+"""
+Batch detection equivalence tests
+Checks detect_batch against the original per-hand if-chain (kept as
+benchmark_detection.scalar_gesture) on 20k random hands, both as one block
+and one hand at a time (the live path).
+Needs NumPy only - run with pytest or directly.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+from batch_detection import BatchDetector, HandBlock, GESTURE_LABELS, detect_batch
+from benchmark_detection import scalar_gesture
+from motion_filter import PalmMotionFilter
+
+HANDS = 20000
+SWIPE_SPEED = 650
+
+
+def random_hands(count, seed=0):
+    """Random hands with integer velocities (so ties and exact-threshold speeds occur),
+    some without velocity and some with too few digits"""
+    rng = np.random.default_rng(seed)
+    hands = []
+    for i in range(count):
+        digit_count = 5 if rng.random() < 0.95 else int(rng.integers(0, 5))
+        digits = [SimpleNamespace(is_extended=bool(e)) for e in rng.random(digit_count) < 0.4]
+        velocity = None
+        if rng.random() < 0.9:
+            x, y, z = (int(v) for v in rng.integers(-900, 901, 3))
+            velocity = SimpleNamespace(x=x, y=y, z=z)
+        position = SimpleNamespace(x=0.0, y=200.0, z=0.0)
+        hands.append(SimpleNamespace(
+            id=i, digits=digits,
+            palm=SimpleNamespace(velocity=velocity, position=position),
+            grab_strength=float(rng.random())))
+    return hands
+
+
+def check_equivalence(poses):
+    hands = random_hands(HANDS)
+    expected = [scalar_gesture(hand, SWIPE_SPEED, poses) for hand in hands]
+
+    # Whole block at once
+    codes = detect_batch(HandBlock.from_hands([[hand] for hand in hands], 1), SWIPE_SPEED, poses)
+    assert list(GESTURE_LABELS[codes[:, 0]]) == expected
+
+    # One 1 x 1 block per hand, as GestureToPLC.detect_gesture does
+    detector = BatchDetector(SWIPE_SPEED, poses)
+    block = HandBlock(1, 1)
+    for hand, label in zip(hands, expected):
+        block.set_hand(0, 0, hand, detector.palm_velocity(hand, 0.0))
+        assert GESTURE_LABELS[detector.detect(block)[0, 0]] == label
+
+
+def test_batch_matches_reference_with_poses():
+    check_equivalence(poses=True)
+
+
+def test_batch_matches_reference_swipes_only():
+    check_equivalence(poses=False)
+
+
+def test_from_config_uses_swipe_speed():
+    detector = BatchDetector.from_config({'detection': {'swipe_speed': 300}})
+    assert detector.swipe_speed == 300
+    assert detector.motion_filter is None
+
+    block = HandBlock(1, 1)
+    block.valid[0, 0] = True
+    block.velocity[0, 0] = (400.0, 0.0, 0.0)
+    assert GESTURE_LABELS[detector.detect(block)[0, 0]] == 'swipe_right'
+    assert GESTURE_LABELS[detect_batch(block)[0, 0]] == 'none'
+
+
+def test_build_block_filters_velocity():
+    config = {'detection': {'swipe_speed': SWIPE_SPEED}, 'motion_filter': {'enabled': True}}
+    hands = random_hands(200, seed=1)
+    frames = [[hand] for hand in hands]
+    timestamps = [i / 120.0 for i in range(len(frames))]
+    for hand in hands:
+        hand.id = 0  # One hand tracked across frames
+
+    block = BatchDetector.from_config(config).build_block(frames, timestamps, hands=1)
+
+    motion_filter = PalmMotionFilter()
+    for f, (hand, timestamp) in enumerate(zip(hands, timestamps)):
+        if not hand.palm.velocity:
+            continue
+        position = hand.palm.position
+        velocity = hand.palm.velocity
+        _, filtered = motion_filter.update(0, timestamp, (position.x, position.y, position.z),
+                                           (velocity.x, velocity.y, velocity.z))
+        if block.valid[f, 0]:
+            assert np.allclose(block.velocity[f, 0], filtered)
+
+
+if __name__ == "__main__":
+    test_batch_matches_reference_with_poses()
+    test_batch_matches_reference_swipes_only()
+    test_from_config_uses_swipe_speed()
+    test_build_block_filters_velocity()
+    print("[TEST] Batch detection matches the reference rules")
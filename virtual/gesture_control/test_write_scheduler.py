@@ -0,0 +1,87 @@
+"""
+Write scheduler replay tests
+Runs the scheduler and supervisor against a fake PLC whose writes always
+fail (while reconnects succeed), and checks that a gesture is replayed at
+most once and never past replay_max_age. Needs no PLC - run with pytest
+or directly.
+"""
+
+import time
+
+from connection_supervisor import ConnectionSupervisor, DROPPED
+from write_scheduler import WriteScheduler, EXPIRED, DEFAULT_CLASS
+
+REPLAY_MAX_AGE = 0.3
+
+
+class BrokenPLC:
+    """Accepts every connection but fails every write"""
+
+    def __init__(self):
+        self.ip = 'fake'
+        self.gesture_addresses = {'swipe_left': ('M', 0, 0)}
+        self.presses = []  # time.monotonic() of each attempted press
+
+    def connect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def get_connection_state(self):
+        return "CONNECTED"
+
+    def update_byte(self, byte_offset, set_mask=0, clear_mask=0, deadline=None):
+        if set_mask:
+            self.presses.append(time.monotonic())
+        return None
+
+
+def start_scheduler(plc):
+    supervisor = ConnectionSupervisor(plc, failure_threshold=1, base_delay=0.01, max_delay=0.02,
+                                      jitter=0.0, replay_max_age=REPLAY_MAX_AGE)
+    scheduler = WriteScheduler(plc, max_gesture_age=0.5, supervisor=supervisor)
+    scheduler.start()
+    return scheduler, supervisor
+
+
+def stop_scheduler(scheduler, supervisor):
+    supervisor.stop()
+    scheduler.stop()
+
+
+def test_failed_replay_is_not_held_again():
+    plc = BrokenPLC()
+    scheduler, supervisor = start_scheduler(plc)
+    replay_failed = DROPPED.labels('replay_failed').value()
+
+    detected_at = time.monotonic()
+    scheduler.submit('swipe_left', detected_at)
+    time.sleep(1.0)
+    stop_scheduler(scheduler, supervisor)
+
+    # The original press and one replay, both within replay_max_age
+    assert len(plc.presses) == 2
+    assert max(plc.presses) - detected_at <= REPLAY_MAX_AGE
+    assert DROPPED.labels('replay_failed').value() == replay_failed + 1
+    assert not supervisor.buffer
+
+
+def test_replay_keeps_detection_time():
+    plc = BrokenPLC()
+    scheduler, supervisor = start_scheduler(plc)
+    expired = EXPIRED.labels(DEFAULT_CLASS).value()
+
+    # Fresh enough when handed over, but stale by replay_max_age from detection
+    scheduler._on_recover([('swipe_left', time.monotonic() - REPLAY_MAX_AGE - 0.01)])
+    time.sleep(0.2)
+    stop_scheduler(scheduler, supervisor)
+
+    assert plc.presses == []
+    assert EXPIRED.labels(DEFAULT_CLASS).value() == expired + 1
+
+
+if __name__ == "__main__":
+    test_failed_replay_is_not_held_again()
+    test_replay_keeps_detection_time()
+    print("[TEST] Replayed gestures keep their age and are replayed at most once")